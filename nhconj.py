@@ -5,15 +5,36 @@
 # @author David Foster
 # 
 
+import array
+import bisect
+import collections
+import functools
+import io
+import itertools
+import os
 import sys
-import traceback
+import time
+
+# NOTE: Modules needed only by some commands (argparse, asyncio, heapq, json,
+#       mmap, multiprocessing, socket, subprocess, tempfile, traceback) are
+#       imported where they are used, since the CLI is often started once per
+#       word.
+#       Check with: python3 -X importtime -c 'import nhconj'
 
 
 # Decorator to mark CLI functions that expect a verb entry rather
 # than just a plain string.
+# 
+# The decorated function always receives a VerbEntry, even if it was
+# called with a { 'dict_verb': ..., 'is_ru_verb': ... } dict.
 def expects_verb_entry(func):
-    func.expects_verb_entry = True
-    return func
+    @functools.wraps(func)
+    def wrapper(verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        return func(verb_entry)
+    wrapper.expects_verb_entry = True
+    return wrapper
 
 
 _HIRAGANA_COLS = 'aiueo'
@@ -44,10 +65,30 @@ for (prefix, kanas) in _HIRAGANA_ROWS:
         kana = kanas[i]
         _ROMAJI_FOR_KANA[kana] = romaji
 
+# Small kana, which follow another kana to modify its sound. (ex: ちゃ, かった)
+_SMALL_KANA = {
+    'ぁ': 'xa', 'ぃ': 'xi', 'ぅ': 'xu', 'ぇ': 'xe', 'ぉ': 'xo',
+    'っ': 'xtsu', 'ゃ': 'xya', 'ゅ': 'xyu', 'ょ': 'xyo', 'ゎ': 'xwa',
+}
+_ROMAJI_FOR_KANA.update(_SMALL_KANA)
+
 _KANA_FOR_ROMAJI = {rj : kana for (kana, rj) in _ROMAJI_FOR_KANA.items()}
 
+# Distance from each katakana to the hiragana with the same sound.
+_KATAKANA_OFFSET = ord('ア') - ord('あ')
+
+# Romaji of every hiragana and katakana character, so that romaji() needs
+# a single lookup even for katakana.
+_ROMAJI_FOR_ANY_KANA = dict(_ROMAJI_FOR_KANA)
+_ROMAJI_FOR_ANY_KANA.update({
+    chr(ord(kana) + _KATAKANA_OFFSET): rj
+    for (kana, rj) in _ROMAJI_FOR_KANA.items()
+    if 'ぁ' <= kana <= 'ゖ'
+})
+
+# Given a hiragana or katakana character, returns its romaji.
 def romaji(kana_character):
-    romaji = _ROMAJI_FOR_KANA.get(kana_character)
+    romaji = _ROMAJI_FOR_ANY_KANA.get(kana_character)
     if romaji is not None:
         return romaji
     else:
@@ -62,36 +103,462 @@ def unromaji(romaji_character_pair):
         raise ValueError(
             'Expected romaji character pair: ' + romaji_character_pair)
 
+# Like romaji() and unromaji(), but return None rather than raising
+# ValueError, for callers that expect much of their input to be invalid.
+def try_romaji(kana_character):
+    return _ROMAJI_FOR_ANY_KANA.get(kana_character)
 
-# Given a verb in dictionary form, returns its possible stem-forms.
-# Rules are based on Genki I, 2nd Ed, §3.1.
-@expects_verb_entry
-def stem(verb_entry):
-    dict_verb = verb_entry['dict_verb']
-    
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'し'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'き'
+def try_unromaji(romaji_character_pair):
+    return _KANA_FOR_ROMAJI.get(romaji_character_pair)
+
+
+# Returns a table of (kana, from_vowel, to_vowel) -> kana.
+# 
+# Exception: [u] -> [w*] when the result would otherwise be a bare vowel.
+# (ex: ('う', 'u', 'a') -> 'わ')
+def _build_vowel_shift_table():
+    table = {}
+    for (kana, rj) in _ROMAJI_FOR_KANA.items():
+        from_vowel = rj[-1]
+        if kana == '　' or kana in _SMALL_KANA or from_vowel not in _HIRAGANA_COLS:
+            continue
+        for to_vowel in _HIRAGANA_COLS:
+            shifted = rj[:-1] + to_vowel
+            if from_vowel == 'u' and shifted in ['a', 'o', 'u']:
+                shifted = 'w' + shifted
+            shifted_kana = _KANA_FOR_ROMAJI.get(shifted)
+            if shifted_kana is not None and shifted_kana != '　':
+                table[(kana, from_vowel, to_vowel)] = shifted_kana
+    return table
+
+_KANA_FOR_VOWEL_SHIFT = _build_vowel_shift_table()
+
+# Given a kana character, returns the kana in the same row of the syllabary
+# with its vowel changed. (ex: shift_vowel('く', 'u', 'i') -> 'き')
+def shift_vowel(kana_character, from_vowel, to_vowel):
+    kana = _KANA_FOR_VOWEL_SHIFT.get((kana_character, from_vowel, to_vowel))
+    if kana is not None:
+        return kana
+    else:
+        raise ValueError(
+            'Expected kana character ending with vowel "' + from_vowel + '": ' +
+            kana_character)
+
+
+# Returns the dict-form verb split into the part before its okurigana, usually
+# kanji, and its trailing hiragana. (ex: '出て行く' -> ('出て行', 'く'))
+def okurigana_split(word):
+    i = len(word)
+    while i and 'ぁ' <= word[i - 1] <= 'ゖ':
+        i -= 1
+    return (word[:i], word[i:])
+
+# Conjugation classes of irregular verbs.
+_IRREGULAR_CLASSES = frozenset(['する', 'くる', '来る'])
+
+# Returns the class of conjugation rules that apply to a dict-form verb:
+# * 'する', 'くる', or '来る' for an irregular verb, (ex: べんきょうする, もってくる)
+# * 'いく' or 'ある' for a verb with exceptional forms, (ex: 出て行く, かいてある)
+# * 'る-verb' for a る-verb,
+# * otherwise the last kana of an う-verb. (ex: 'く')
+# 
+# Only the end of the verb is examined, so kanji stems work too.
+# Verbs that merely end in くる are regular. (ex: つくる, おくる)
+def _conjugation_class(dict_verb, is_ru_verb):
+    if dict_verb.endswith('る'):
+        if dict_verb.endswith('する'):
+            return 'する'
+        if dict_verb == 'くる' or dict_verb.endswith(('てくる', 'でくる')):
+            return 'くる'
+        if dict_verb.endswith('来る'):
+            return '来る'
+        if dict_verb == 'ある' or dict_verb.endswith(('てある', 'である')):
+            return 'ある'
+        if is_ru_verb:
+            return 'る-verb'
+    elif dict_verb == 'いく' or dict_verb.endswith(('行く', 'ていく', 'でいく')):
+        return 'いく'
+    return dict_verb[-1:]
+
+
+# An immutable verb in dictionary form, along with facts derived from it
+# that conjugators would otherwise recompute for every form.
+# 
+# For compatibility, also supports verb_entry['dict_verb'] and
+# verb_entry['is_ru_verb'] like the dicts that conjugators used to take.
+class VerbEntry:
+    __slots__ = (
+        'dict_verb',
+        'is_ru_verb',
+        'last_kana',         # ex: 'く'
+        'last_romaji',       # ex: 'ku', or None if last_kana is not kana
+        'irregular_ending',  # 'する', 'くる', '来る', or None
+        'conjugation_class', # see _conjugation_class()
+    )
     
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1]
+    def __init__(self, dict_verb, is_ru_verb):
+        last_kana = dict_verb[-1:]
+        conjugation_class = _conjugation_class(dict_verb, is_ru_verb)
+        if conjugation_class in _IRREGULAR_CLASSES:
+            irregular_ending = conjugation_class
         else:
-            return dict_verb[:-1] + 'り'
+            irregular_ending = None
+        
+        init = object.__setattr__
+        init(self, 'dict_verb', dict_verb)
+        init(self, 'is_ru_verb', bool(is_ru_verb))
+        init(self, 'last_kana', last_kana)
+        init(self, 'last_romaji', _ROMAJI_FOR_KANA.get(last_kana))
+        init(self, 'irregular_ending', irregular_ending)
+        init(self, 'conjugation_class', conjugation_class)
+    
+    @classmethod
+    def from_dict(cls, verb_entry):
+        return cls(verb_entry['dict_verb'], verb_entry['is_ru_verb'])
     
-    # ~u -> ~i
-    return _replace_vowel_suffix(dict_verb, 'u', 'i')
+    def __getitem__(self, key):
+        if key not in ['dict_verb', 'is_ru_verb']:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('VerbEntry is immutable')
+    
+    def __delattr__(self, name):
+        raise AttributeError('VerbEntry is immutable')
+    
+    def __eq__(self, other):
+        if type(other) is not VerbEntry:
+            return NotImplemented
+        return (
+            self.dict_verb == other.dict_verb and
+            self.is_ru_verb == other.is_ru_verb
+        )
+    
+    def __hash__(self):
+        return hash((self.dict_verb, self.is_ru_verb))
+    
+    def __repr__(self):
+        return 'VerbEntry(%r, %r)' % (self.dict_verb, self.is_ru_verb)
+    
+    def __reduce__(self):
+        return (VerbEntry, (self.dict_verb, self.is_ru_verb))
+
+
+# う-verbs ending in る whose stem nonetheless ends with an い- or え-sound,
+# which would otherwise look like る-verbs. (Genki I p. 39)
+# 
+# Also lists verbs whose stem ends in kanji, since the sound before る
+# cannot be read from the spelling.
+_U_VERBS_ENDING_IN_RU = frozenset([
+    'はいる', 'しる', 'はしる', 'しゃべる', 'すべる', 'にぎる', 'あせる', 'ける',
+    'まいる', 'いじる', 'まじる', 'かぎる', 'ちる', 'てる', 'ひねる', 'しげる',
+    'ののしる', 'あざける', 'ひるがえる', 'よみがえる', 'くつがえる', 'おちいる',
+    'めいる', 'せびる', 'なじる', 'けずる',
+    '入る', '帰る', '知る', '切る', '要る', '走る', '減る', '蹴る', '散る', '限る',
+    '握る', '滑る', '焦る', '喋る', '照る', '練る', '参る', '陥る', '茂る', '湿る',
+    '耽る', '罵る', '嘲る', '覆る', '翻る', '蘇る', '混じる', '交じる', '捻る',
+    '取る', '売る', '乗る', '鳴る', '成る', '去る', '振る', '張る', '貼る', '刷る',
+    '擦る', '剃る', '釣る', '吊る', '塗る', '彫る', '掘る', '織る', '折る', '送る',
+    '祈る', '計る', '測る', '量る', '図る', '盛る', '守る', '光る', '困る', '移る',
+    '写る', '映る', '配る', '作る', '造る', '創る', '座る', '坐る', '太る', '刈る',
+    '狩る', '寄る', '依る', '因る', '拠る', '降る', '凍る', '残る',
+])
+
+# る-verbs whose stem ends in kanji. (ex: 見る, 寝る)
+_RU_VERBS_ENDING_IN_KANJI = frozenset([
+    '見る', '着る', '寝る', '出る', '似る', '居る', '煮る', '得る', '経る', '射る',
+    '鋳る', '診る', '干る', '観る', '視る', '看る', '覧る',
+])
+
+# Kana spellings of both a る-verb and an う-verb. (ex: かえる = 変える or 帰る)
+# The verb class of these cannot be resolved without more context.
+_AMBIGUOUS_VERBS = frozenset([
+    'かえる', 'きる', 'いる', 'へる', 'ねる', 'しめる', 'ふける',
+])
+
+# Returns whether the specified dict-form verb is a る-verb (True),
+# an う-verb (False), or cannot be decided from its spelling alone (None).
+# 
+# Verbs ending in anything but る are always う-verbs.
+# Verbs ending in -aru, -uru, or -oru are always う-verbs.
+# Verbs ending in -iru or -eru are usually る-verbs,
+# except for those listed in _U_VERBS_ENDING_IN_RU. (Genki I p. 39)
+def guess_is_ru_verb(dict_verb):
+    if not dict_verb.endswith('る') or len(dict_verb) < 2:
+        return False
+    if dict_verb in _AMBIGUOUS_VERBS:
+        return None
+    if dict_verb in _U_VERBS_ENDING_IN_RU:
+        return False
+    if dict_verb in _RU_VERBS_ENDING_IN_KANJI:
+        return True
+    
+    (_, okurigana) = okurigana_split(dict_verb)
+    romaji = _ROMAJI_FOR_KANA.get(okurigana[-2:-1])
+    if romaji is None:
+        # Stem ends in kanji or katakana
+        return None
+    return romaji[-1] in 'ie'
+
+
+# Keys that hold a rule's value inside a trie node. Real children are keyed
+# by single characters, so these multi-character keys can never collide.
+_TRIE_SUFFIX_VALUE = 'suffix'
+_TRIE_WORD_VALUE = 'word'
+
+# Compiles rules of the form (suffix, is_whole_word, value) into a trie
+# that is keyed by the characters of each suffix read from right to left.
+# 
+# A whole-word rule only matches when the entire word equals its suffix.
+def _compile_suffix_trie(rules):
+    trie = {}
+    for (suffix, is_whole_word, value) in rules:
+        node = trie
+        for c in reversed(suffix):
+            node = node.setdefault(c, {})
+        key = _TRIE_WORD_VALUE if is_whole_word else _TRIE_SUFFIX_VALUE
+        if key in node:
+            raise ValueError('Duplicate rule for suffix: ' + suffix)
+        node[key] = value
+    return trie
+
+
+# Normalization of words typed or pasted by a user, which are often written
+# in katakana or romaji rather than hiragana.
+
+_KATAKANA_CHARACTERS = ''.join(map(chr, range(ord('ァ'), ord('ヶ') + 1)))
+_HIRAGANA_FOR_KATAKANA = str.maketrans({
+    katakana: chr(ord(katakana) - _KATAKANA_OFFSET)
+    for katakana in _KATAKANA_CHARACTERS
+})
+
+# Folds romaji to lowercase ASCII. (ex: 'Ｔａｂｅｒｕ' -> 'taberu')
+_ROMAJI_FOLDING = str.maketrans(
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        'ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ'
+        'ａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ’＇',
+    'abcdefghijklmnopqrstuvwxyz' * 3 + "''")
+_ROMAJI_CHARACTERS = "abcdefghijklmnopqrstuvwxyz'" + ''.join(map(chr, _ROMAJI_FOLDING))
+
+# Returns romaji -> hiragana for every spelling that normalize() reads:
+# * kunrei-shiki, as romaji() writes it, (ex: si, tu, sya)
+# * Hepburn, (ex: shi, tsu, sha)
+# * a doubled consonant for っ, (ex: kka -> っか, tchi -> っち) and
+# * n' for ん before a vowel. (ex: kin'en -> きんえん)
+def _build_kana_for_romaji_input():
+    kana_for_romaji = {
+        rj: kana for (kana, rj) in _ROMAJI_FOR_KANA.items() if kana != '　'
+    }
+    kana_for_romaji.update({
+        'shi': 'し', 'chi': 'ち', 'tsu': 'つ', 'fu': 'ふ', 'ji': 'じ',
+        'xtu': 'っ', 'ltu': 'っ', 'ltsu': 'っ', "n'": 'ん',
+    })
+    for (prefix, kana) in [
+            ('ky', 'き'), ('gy', 'ぎ'), ('sy', 'し'), ('sh', 'し'), ('zy', 'じ'),
+            ('jy', 'じ'), ('j', 'じ'), ('ty', 'ち'), ('cy', 'ち'), ('ch', 'ち'),
+            ('dy', 'ぢ'), ('ny', 'に'), ('hy', 'ひ'), ('by', 'び'), ('py', 'ぴ'),
+            ('my', 'み'), ('ry', 'り')]:
+        for (vowel, small_kana) in zip('auo', 'ゃゅょ'):
+            kana_for_romaji[prefix + vowel] = kana + small_kana
+    for (rj, kana) in list(kana_for_romaji.items()):
+        if rj[0] not in "aiueonxl'":
+            kana_for_romaji[rj[0] + rj] = 'っ' + kana
+            if rj.startswith('ch'):
+                kana_for_romaji['t' + rj] = 'っ' + kana
+    return kana_for_romaji
+
+# Trie of every romaji spelling that normalize() reads, keyed by its
+# characters from left to right. Built from the reversed spellings,
+# since _compile_suffix_trie() reads each suffix from right to left.
+_ROMAJI_INPUT_TRIE = _compile_suffix_trie([
+    (rj[::-1], False, kana) for (rj, kana) in _build_kana_for_romaji_input().items()
+])
+
+# Given a word typed or pasted by a user, returns it in hiragana if it is
+# written entirely in katakana or entirely in romaji, or otherwise unchanged.
+# (ex: 'タベル' -> 'たべる', 'taberu' -> 'たべる', 'ググる' -> 'ググる')
+# 
+# Romaji may be Hepburn or kunrei-shiki, in either case, and is read by
+# longest match. (ex: 'kanji' -> 'かんじ', 'kani' -> 'かに')
+# A word that is not valid romaji is returned unchanged.
+# 
+# A word is only examined further if its last character is katakana or
+# romaji, so hiragana and kanji pass through with one set lookup.
+# Other words are cached, up to _NORMALIZED_WORD_CACHE_SIZE of them.
+def normalize(word):
+    last = word[-1:]
+    if last not in _KATAKANA_AND_ROMAJI_SET:
+        return word
+    normalized = _NORMALIZED_WORDS.get(word)
+    if normalized is None:
+        if last in _ROMAJI_SET:
+            normalized = _unromaji_word(word.translate(_ROMAJI_FOLDING))
+        elif not word.strip(_KATAKANA_CHARACTERS):
+            normalized = word.translate(_HIRAGANA_FOR_KATAKANA)
+        if normalized is None:
+            normalized = word
+        if len(_NORMALIZED_WORDS) >= _NORMALIZED_WORD_CACHE_SIZE:
+            _NORMALIZED_WORDS.clear()
+        _NORMALIZED_WORDS[word] = normalized
+    return normalized
+
+_ROMAJI_SET = frozenset(_ROMAJI_CHARACTERS)
+_KATAKANA_AND_ROMAJI_SET = frozenset(_KATAKANA_CHARACTERS) | _ROMAJI_SET
+_NORMALIZED_WORDS = {}
+_NORMALIZED_WORD_CACHE_SIZE = 65536
+
+# Given a word in lowercase ASCII, returns it in hiragana, reading the
+# longest romaji spelling at each position, or None if it is not romaji.
+def _unromaji_word(word):
+    trie = _ROMAJI_INPUT_TRIE
+    length = len(word)
+    kanas = []
+    i = 0
+    while i < length:
+        node = trie
+        kana = None
+        for j in range(i, length):
+            node = node.get(word[j])
+            if node is None:
+                break
+            if _TRIE_SUFFIX_VALUE in node:
+                (kana, end) = (node[_TRIE_SUFFIX_VALUE], j + 1)
+        if kana is None:
+            return None
+        kanas.append(kana)
+        i = end
+    return ''.join(kanas)
+
+# Given lines, yields each one stripped and passed through normalize(),
+# reading lines only as they are needed.
+def normalize_lines(lines):
+    for line in lines:
+        yield normalize(line.strip())
+
+
+# Rules for the forms that _compile_form() generates, keyed by form name,
+# as (する ending, くる ending, る-verb ending, う-verb endings, exceptions):
+# * The する and くる endings replace the last 2 kana of a verb ending in
+#   する or くる. The kanji 来 replaces the first kana of the くる ending
+#   for a verb ending in 来る. The る-verb ending replaces the final る.
+# * The う-verb endings are either a dict of last kana -> ending, or a
+#   (vowel, tail) pair that shifts the last kana to that vowel and adds tail,
+#   optionally followed by a dict of last kana -> ending for exceptions.
+# * Exceptions map the conjugation class of an exceptional verb to
+#   (number of kana to drop, ending to add). Otherwise verbs of class いく
+#   conjugate like those ending in く, and verbs of class ある like those
+#   ending in る.
+# 
+# Adding a form that follows the same pattern only needs a row here.
+_FORM_RULES = {
+    # ~u -> ~i (Genki I, 2nd Ed, §3.1)
+    'stem': ('し', 'き', '', ('i', ''), {}),
+    
+    # ~u -> ~anai (Genki I, 2nd Ed, §8.1)
+    'short_present_neg': ('しない', 'こない', 'ない', ('a', 'ない'), {
+        'ある': (2, 'ない'),
+    }),
+    
+    # ~u -> ~eru (Genki I, 2nd Ed, §13.1)
+    'potential': ('できる', 'こられる', 'られる', ('e', 'る'), {}),
+    
+    # ~u -> ~ou (Genki I, 2nd Ed, §15.1)
+    'volitional': ('しよう', 'こよう', 'よう', ('o', 'う'), {}),
+    
+    # ~u -> ~areru (Genki I, 2nd Ed, §21.1)
+    'passive': ('される', 'こられる', 'られる', ('a', 'れる'), {}),
+    
+    # ~u -> ~aseru (Genki II, 2nd Ed, §22)
+    'causative': ('させる', 'こさせる', 'させる', ('a', 'せる'), {}),
+    
+    # ~u -> ~asareru, except ~su -> ~saserareru (Genki II, 2nd Ed, §23)
+    'causative_passive': ('させられる', 'こさせられる', 'させられる', ('a', 'される', {
+        'す': 'させられる',
+    }), {}),
+    
+    # ~u -> ~e
+    'imperative': ('しろ', 'こい', 'ろ', ('e', ''), {}),
+    
+    # ~u -> ~eba (Genki II, 2nd Ed, §22)
+    'ba': ('すれば', 'くれば', 'れば', ('e', 'ば'), {}),
+    
+    # (Genki I, 2nd Ed, §6.1)
+    'te': ('して', 'きて', 'て', {
+        'う': 'って', 'つ': 'って', 'る': 'って',
+        'む': 'んで', 'ぶ': 'んで', 'ぬ': 'んで',
+        'く': 'いて',
+        'ぐ': 'いで',
+        'す': 'して',
+    }, {
+        'いく': (1, 'って'),
+    }),
+}
+
+# Generates the conjugator for the named form from its row in _FORM_RULES.
+# 
+# The generated function makes a single dict lookup keyed by the verb entry's
+# conjugation_class, rather than testing each class in turn.
+# Like functions decorated with @expects_verb_entry, it also accepts a dict.
+# 
+# The function also has:
+# * conjugation_classes - the classes it accepts,
+# * last_characters - the last character of every verb it accepts, and
+# * error_message - what its ValueError says before the dict_verb of any other.
+def _compile_form(form_name):
+    (suru_ending, kuru_ending, ru_verb_ending, u_verb_endings, exceptions) = \
+        _FORM_RULES[form_name]
+    
+    # conjugation_class -> (number of kana to drop, ending to add)
+    rules = {
+        'する': (2, suru_ending),
+        'くる': (2, kuru_ending),
+        'る-verb': (1, ru_verb_ending),
+    }
+    if isinstance(u_verb_endings, tuple):
+        (new_vowel, tail, *kana_exceptions) = u_verb_endings
+        for ((kana, old_vowel, to_vowel), shifted_kana) in _KANA_FOR_VOWEL_SHIFT.items():
+            if old_vowel == 'u' and to_vowel == new_vowel:
+                rules[kana] = (1, shifted_kana + tail)
+        for (kana, ending) in (kana_exceptions[0] if kana_exceptions else {}).items():
+            rules[kana] = (1, ending)
+        error_message = 'Expected verb to end with vowel "u": '
+    else:
+        for (kana, ending) in u_verb_endings.items():
+            rules[kana] = (1, ending)
+        error_message = 'Expected verb in dictionary form: '
+    rules['来る'] = (1, kuru_ending[1:])
+    rules['いく'] = rules['く']
+    rules['ある'] = rules['る']
+    rules.update(exceptions)
+    
+    # Does the same as @expects_verb_entry, but without an extra call
+    def form(verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        rule = rules.get(verb_entry.conjugation_class)
+        if rule is None:
+            raise ValueError(error_message + verb_entry.dict_verb)
+        return verb_entry.dict_verb[:-rule[0]] + rule[1]
+    form.__name__ = form.__qualname__ = form_name
+    form.expects_verb_entry = True
+    form.conjugation_classes = frozenset(rules)
+    form.last_characters = frozenset(
+        'る' if conjugation_class == 'る-verb' else conjugation_class[-1]
+        for conjugation_class in rules)
+    form.error_message = error_message
+    return form
+
+
+# Given a verb in dictionary form, returns its possible stem-forms.
+# Rules are based on Genki I, 2nd Ed, §3.1.
+stem = _compile_form('stem')
 
 def _replace_vowel_suffix(dict_verb, old_vowel, new_vowel):
-    last = romaji(dict_verb[-1])
-    if last[-1] != old_vowel:
+    last = _KANA_FOR_VOWEL_SHIFT.get((dict_verb[-1:], old_vowel, new_vowel))
+    if last is None:
         raise ValueError(
             'Expected verb to end with vowel "' + old_vowel + '": ' + dict_verb)
-    last = last[:-1] + new_vowel
-    if old_vowel == 'u' and last in ['a', 'o', 'u']:    # exception: [u] -> [w*]
-        last = 'w' + last
-    last = unromaji(last)
     return dict_verb[:-1] + last
 
 
@@ -123,29 +590,11 @@ def long_past_neg(verb_entry):
 # Rules are based on Genki I, 2nd Ed, §8.1.
 @expects_verb_entry
 def short_present_aff(verb_entry):
-    return verb_entry['dict_verb']
+    return verb_entry.dict_verb
 
 
 # Rules are based on Genki I, 2nd Ed, §8.1.
-@expects_verb_entry
-def short_present_neg(verb_entry):
-    dict_verb = verb_entry['dict_verb']
-    
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'しない'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'こない'
-    if dict_verb == 'ある':
-        return 'ない'
-    
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1] + 'ない'
-        else:
-            return dict_verb[:-1] + 'らない'
-    
-    # ~u -> ~anai
-    return _replace_vowel_suffix(dict_verb, 'u', 'a') + 'ない'
+short_present_neg = _compile_form('short_present_neg')
 
 
 # Rules are based on Genki I, 2nd Ed, §9.1.
@@ -174,70 +623,51 @@ def tari(verb_entry):
 
 # Rules are based on Genki I, 2nd Ed, §13.1.
 # Can..., Has the ability to...
-@expects_verb_entry
-def potential(verb_entry):
-    dict_verb = verb_entry['dict_verb']
-    
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'できる'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'こられる'
-    
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1] + 'られる'
-        else:
-            return dict_verb[:-1] + 'れる'
-    
-    # ~u -> ~eru
-    return _replace_vowel_suffix(dict_verb, 'u', 'e') + 'る'
+potential = _compile_form('potential')
 
 
 # Rules are based on Genki I, 2nd Ed, §15.1.
 # Lets... [casual]
-@expects_verb_entry
-def volitional(verb_entry):
-    dict_verb = verb_entry['dict_verb']
-    
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'しよう'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'こよう'
-    
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1] + 'よう'
-        else:
-            return dict_verb[:-1] + 'ろう'
-    
-    # ~u -> ~ou
-    return _replace_vowel_suffix(dict_verb, 'u', 'o') + 'う'
+volitional = _compile_form('volitional')
 
 
 # Rules are based on Genki I, 2nd Ed, §21.1.
 # NOTE: Passive forms of verbs themselves conjugate as regular る-verbs.
+passive = _compile_form('passive')
+
+
+# Rules are based on Genki II, 2nd Ed, §22.
+# Makes... / Lets...
+# NOTE: Causative forms of verbs themselves conjugate as regular る-verbs.
+causative = _compile_form('causative')
+
+
+# Rules are based on Genki II, 2nd Ed, §23.
+# Is made to...
+# NOTE: Causative-passive forms of verbs themselves conjugate as regular る-verbs.
+causative_passive = _compile_form('causative_passive')
+
+
+# Do...! [blunt]
+imperative = _compile_form('imperative')
+
+
+# Rules are based on Genki II, 2nd Ed, §17.
+# If/When...
 @expects_verb_entry
-def passive(verb_entry):
-    dict_verb = verb_entry['dict_verb']
-    
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'される'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'こられる'
-    
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1] + 'られる'
-        else:
-            return dict_verb[:-1] + 'られる'
-    
-    # ~u -> ~areru
-    return _replace_vowel_suffix(dict_verb, 'u', 'a') + 'れる'
+def tara(verb_entry):
+    return short_past_aff(verb_entry) + 'ら'
+
+
+# Rules are based on Genki II, 2nd Ed, §22.
+# If...
+ba = _compile_form('ba')
 
 
 # Shortened form of 〜てしまう, observed in wild, and explained on:
 # http://everything2.com/title/Japanese+verb+inflection+summary
 # Expresses regret...
+@expects_verb_entry
 def chau(verb_entry):
     return te(verb_entry)[:-1] + 'ちゃ'
 
@@ -250,119 +680,1774 @@ def chau(verb_entry):
 #    return te(verb_entry)[:-1] + 'ちまう'
 
 
-# Given a verb in て-form, returns its possible dictionary forms.
+# Rules for unte(), as (te_suffix, is_whole_word, dict_suffixes).
 # 
-# Also, given an adjective in て-form, returns its single possible
-# dictionary form. (ex: 'あつくなって' -> ['あつい + negative'])
-def unte(te_form):
+# The longest matching te_suffix wins, so rules may be listed in any order.
+# Each dict_suffix replaces the te_suffix to form one possible dictionary form.
+_UNTE_RULES = (
     # Reverse irr-adjectives in て-form
     # based on rules from Genki I, 2nd Ed, §7.3
-    if te_form == 'よくて':
-        return ['いい']
+    ('よくて', True, ['いい']),
     
     # Reverse い-adjectives in て-form
     # based on rules from Genki I, 2nd Ed, §7.3
-    # 
-    # NOTE: Must be before the 〜て rule below
-    if te_form.endswith('くて'):
-        prefix = te_form[:-2]
-        return [prefix + 'い']
-    if te_form.endswith('くなって'):  # based on empirical observation
-        prefix = te_form[:-4]
-        return [prefix + 'い + negative']
+    ('くて', False, ['い']),
+    ('くなくて', False, ['い + negative']),
+    ('くなって', False, ['い + negative']),  # based on empirical observation
     
     # Reverse verbs in て-form,
     # based on rules from Genki I, 2nd Ed, §6.1
-    if te_form == 'いって':
-        return ['いく']
-    if te_form.endswith('って'):
-        prefix = te_form[:-2]
-        return [
-            prefix + 'う',
-            prefix + 'つ',
-            prefix + 'る',
-        ]
-    if te_form.endswith('んで'):
-        prefix = te_form[:-2]
-        return [
-            prefix + 'む',
-            prefix + 'ぶ',
-            prefix + 'ぬ',
-        ]
-    if te_form.endswith('いて'):
-        prefix = te_form[:-2]
-        return [prefix + 'く']
-    if te_form.endswith('いで'):
-        prefix = te_form[:-2]
-        return [prefix + 'ぐ']
-    if te_form.endswith('して'):
-        prefix = te_form[:-2]
-        return [prefix + 'す']
-    if te_form.endswith('て'):
-        prefix = te_form[:-1]
-        return [prefix + 'る']
+    ('いって', True, ['いく']),
+    ('行って', False, ['行く', '行う']),
+    ('ていって', False, ['ていく']),
+    ('でいって', False, ['でいく']),
+    ('きて', True, ['きる', 'くる']),
+    ('てきて', False, ['てくる']),
+    ('して', True, ['する']),
+    ('って', False, ['う', 'つ', 'る']),
+    ('んで', False, ['む', 'ぶ', 'ぬ']),
+    ('いて', False, ['く']),
+    ('いで', False, ['ぐ']),
+    ('して', False, ['す']),
+    ('て', False, ['る']),
     
     # Reverse な-adjectives in て-form
     # based on rules from Genki I, 2nd Ed, §7.3
-    # 
-    # NOTE: Must be after the 〜んで rule above
-    if te_form.endswith('で'):
-        prefix = te_form[:-1]
-        return [prefix]
-    # TODO: What about the negative て-form for な-adjectives?
+    ('で', False, ['']),
+    ('じゃなくて', False, [' + negative']),
+)
+
+_UNTE_TRIE = _compile_suffix_trie(_UNTE_RULES)
+
+# Given a verb in て-form, returns its possible dictionary forms.
+# 
+# Also, given an adjective in て-form, returns its single possible
+# dictionary form. (ex: 'あつくなって' -> ['あつい + negative'])
+def unte(te_form):
+    dict_forms = try_unte(te_form)
+    if dict_forms is None:
+        raise ValueError(
+            'Expected て-form to end with て or で: ' + te_form)
+    return dict_forms
+
+# Like unte(), but returns None rather than raising ValueError
+# if te_form does not end with て or で.
+def try_unte(te_form):
+    # Walk the tail of te_form through the trie, remembering the longest
+    # rule that matched. A whole-word rule wins over a suffix rule.
+    node = _UNTE_TRIE
+    prefix_length = None
+    i = len(te_form)
+    while i:
+        i -= 1
+        node = node.get(te_form[i])
+        if node is None:
+            break
+        if _TRIE_SUFFIX_VALUE in node:
+            prefix_length = i
+            dict_suffixes = node[_TRIE_SUFFIX_VALUE]
+        if i == 0 and _TRIE_WORD_VALUE in node:
+            prefix_length = 0
+            dict_suffixes = node[_TRIE_WORD_VALUE]
+    if prefix_length is None:
+        return None
     
-    raise ValueError(
-        'Expected て-form to end with て or で: ' + te_form)
+    prefix = te_form[:prefix_length]
+    dict_forms = [prefix + dict_suffix for dict_suffix in dict_suffixes]
+    # A bare な-adjective suffix (ex: 'じゃなくて') has no stem to return
+    if _has_empty_stem(dict_forms[0]):
+        return None
+    return dict_forms
+
+def _has_empty_stem(dict_form):
+    return dict_form.split(' + ')[0] == ''
+
+# Given a verb or adjective in て-form, returns the possible dictionary forms
+# from unte() that are words in frequency_table, as (dict_form, score),
+# from most to least frequent. Each score is the word's share of the total
+# count of those words. If k is specified, returns only the first k.
+# (ex: 'よんで' -> [('よむ', 0.8), ('よぶ', 0.2)], since よぬ is not a word)
+def rank_unte(te_form, frequency_table, k=None):
+    ranked = []
+    for dict_form in unte(te_form):
+        count = frequency_table.count(dict_form.partition(' + ')[0])
+        if count:
+            ranked.append((count, dict_form))
+    total = sum(count for (count, _) in ranked)
+    ranked.sort(key=lambda item: -item[0])
+    return [(dict_form, count / total) for (count, dict_form) in ranked[:k]]
+
+# How often each word occurs, for rank_unte().
+# 
+# Words are kept in one sorted list and found by binary search,
+# and their counts in a parallel array, so a large table takes
+# little more memory than its words.
+class FrequencyTable:
+    # Creates a table from (word, count) pairs. Counts of a repeated word add up.
+    def __init__(self, counts):
+        count_for_word = collections.Counter()
+        for (word, count) in counts:
+            count_for_word[word] += count
+        self._words = sorted(count_for_word)
+        self._counts = array.array('Q', [count_for_word[word] for word in self._words])
+    
+    # Returns how often word occurs, or 0 if it is not in the table.
+    def count(self, word):
+        i = bisect.bisect_left(self._words, word)
+        if i < len(self._words) and self._words[i] == word:
+            return self._counts[i]
+        return 0
+    
+    def __contains__(self, word):
+        return self.count(word) != 0
+    
+    def __len__(self):
+        return len(self._words)
+
+# Parses lines of <word> or <word> TAB <count> into (word, count) pairs
+# for FrequencyTable, skipping blank lines and # comments.
+# A word without a count counts once, so a plain word list also works.
+def read_frequencies(lines):
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        (word, _, count) = line.partition('\t')
+        try:
+            yield (word, int(count) if count else 1)
+        except ValueError:
+            raise ValueError('Expected <word> or <word> TAB <count>: ' + line) from None
 
 
 # Given a verb in dictionary form, returns its possible て-forms.
 # Rules are based on Genki I, 2nd Ed, §6.1.
+te = _compile_form('te')
+
+
+# Observed in wild, and explained on:
+# http://www.guidetojapanese.org/learn/grammar/compound
 @expects_verb_entry
-def te(verb_entry):
-    dict_verb = verb_entry['dict_verb']
+def te_neg(verb_entry):
+    return short_present_neg(verb_entry)[:-1] + 'くて'
+
+
+# ------------------------------------------------------------------------------
+# Adjectives
+
+# Prefixes that form an irregular adjective when followed by いい,
+# which conjugates from よい instead. (ex: かっこいい -> かっこよくない)
+# Other adjectives ending in いい are regular. (ex: かわいい -> かわいくない)
+_II_ADJECTIVE_PREFIXES = frozenset([
+    '',
+    'かっこ', '格好', 'かっこう',
+    'きもち', '気持ち',
+    'ちょうど', '丁度',
+    'あたまが', '頭が',
+    'なかが', '仲が',
+    'つごうが', '都合が', 'つごうの', '都合の',
+])
+
+# An immutable adjective in dictionary form.
+# 
+# An い-adjective ends with い. (ex: たかい)
+# A な-adjective is given without its な. (ex: しずか)
+class AdjectiveEntry:
+    __slots__ = (
+        'dict_adjective',
+        'is_na_adjective',
+        'is_irregular',  # whether an い-adjective conjugates like いい
+    )
+    
+    def __init__(self, dict_adjective, is_na_adjective):
+        if not dict_adjective:
+            raise ValueError('Expected adjective in dictionary form: ' + dict_adjective)
+        if not is_na_adjective and not dict_adjective.endswith('い'):
+            raise ValueError('Expected い-adjective to end with い: ' + dict_adjective)
+        is_irregular = (
+            not is_na_adjective and
+            dict_adjective.endswith('いい') and
+            dict_adjective[:-2] in _II_ADJECTIVE_PREFIXES
+        )
+        
+        init = object.__setattr__
+        init(self, 'dict_adjective', dict_adjective)
+        init(self, 'is_na_adjective', bool(is_na_adjective))
+        init(self, 'is_irregular', is_irregular)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('AdjectiveEntry is immutable')
+    
+    def __delattr__(self, name):
+        raise AttributeError('AdjectiveEntry is immutable')
+    
+    def __eq__(self, other):
+        if type(other) is not AdjectiveEntry:
+            return NotImplemented
+        return (
+            self.dict_adjective == other.dict_adjective and
+            self.is_na_adjective == other.is_na_adjective
+        )
+    
+    def __hash__(self):
+        return hash((self.dict_adjective, self.is_na_adjective))
+    
+    def __repr__(self):
+        return 'AdjectiveEntry(%r, %r)' % (self.dict_adjective, self.is_na_adjective)
+    
+    def __reduce__(self):
+        return (AdjectiveEntry, (self.dict_adjective, self.is_na_adjective))
+
+# Rules for conjugate_adjective(), keyed by form name,
+# as (い-adjective ending, な-adjective ending).
+# 
+# The い-adjective ending replaces the final い. For irregular adjectives it
+# replaces the final いい with よ, unless the ending itself starts with い.
+# The な-adjective ending is appended.
+# 
+# Rules are based on Genki I, 2nd Ed, §5.1, §5.2, §7.3, and §8.1.
+_ADJECTIVE_FORM_RULES = {
+    'long_present_aff': ('いです', 'です'),
+    'long_present_neg': ('くないです', 'じゃないです'),
+    'long_past_aff': ('かったです', 'でした'),
+    'long_past_neg': ('くなかったです', 'じゃなかったです'),
+    'short_present_aff': ('い', 'だ'),
+    'short_present_neg': ('くない', 'じゃない'),
+    'short_past_aff': ('かった', 'だった'),
+    'short_past_neg': ('くなかった', 'じゃなかった'),
+    'te': ('くて', 'で'),
+    'te_neg': ('くなくて', 'じゃなくて'),
+}
+
+# Given an adjective entry and the name of a form, returns the conjugated adjective.
+# (ex: conjugate_adjective(AdjectiveEntry('たかい', False), 'short_past_neg') -> 'たかくなかった')
+def conjugate_adjective(adjective_entry, form_name):
+    rule = _ADJECTIVE_FORM_RULES.get(form_name)
+    if rule is None:
+        raise ValueError('Expected adjective form: ' + form_name)
+    (i_ending, na_ending) = rule
     
-    if dict_verb[-2:] in ['する']:
-        return dict_verb[:-2] + 'して'
-    if dict_verb[-2:] in ['くる']:
-        return dict_verb[:-2] + 'きて'
+    dict_adjective = adjective_entry.dict_adjective
+    if adjective_entry.is_na_adjective:
+        return dict_adjective + na_ending
+    if adjective_entry.is_irregular and not i_ending.startswith('い'):
+        return dict_adjective[:-2] + 'よ' + i_ending
+    return dict_adjective[:-1] + i_ending
+
+# Given an adjective entry, returns a dict of every form name -> conjugated adjective.
+def conjugate_all_adjective(adjective_entry):
+    return {
+        form_name: conjugate_adjective(adjective_entry, form_name)
+        for form_name in _ADJECTIVE_FORM_RULES
+    }
+
+
+# Forms that deinflect() can reverse.
+# 
+# stem() is omitted because the stem of a る-verb has no suffix at all,
+# so every word would deinflect as the stem of itself + る.
+_DEINFLECTABLE_FORMS = (
+    long_present_aff,
+    long_present_neg,
+    long_past_aff,
+    long_past_neg,
+    short_present_aff,
+    short_present_neg,
+    short_past_aff,
+    short_past_neg,
+    tai,
+    tari,
+    potential,
+    volitional,
+    passive,
+    causative,
+    causative_passive,
+    imperative,
+    tara,
+    ba,
+    chau,
+    te,
+    te_neg,
+)
+_DEINFLECTABLE_FORM_FOR_NAME = {f.__name__: f for f in _DEINFLECTABLE_FORMS}
+
+# Forms whose output is itself a regular る-verb, and so can be followed
+# by another form. (ex: passive + short_past_aff -> 'たべられた')
+_RU_VERB_FORM_NAMES = ['potential', 'passive', 'causative', 'causative_passive']
+
+# Verb endings that the forward functions are probed with to derive
+# suffix rewrite rules, as (dict_ending, is_ru_verb, is_whole_word).
+_PROBE_VERBS = (
+    ('う', False, False),
+    ('く', False, False),
+    ('ぐ', False, False),
+    ('す', False, False),
+    ('つ', False, False),
+    ('ぬ', False, False),
+    ('ぶ', False, False),
+    ('む', False, False),
+    ('る', False, False),
+    ('る', True, False),
+    ('する', False, False),
+    ('てくる', False, False),
+    ('でくる', False, False),
+    ('来る', False, False),
     
-    if dict_verb in ['いく', '行く']:
-        return dict_verb[:-1] + 'って'
+    # Exceptions
+    ('くる', False, True),
+    ('いく', False, True),
+    ('ていく', False, False),
+    ('でいく', False, False),
+    ('行く', False, False),
+    ('ある', False, True),
+    ('てある', False, False),
+    ('である', False, False),
+)
+
+# Stands in for the part of a verb that conjugation leaves untouched.
+# It is not kana, so no rule can depend on it.
+_PROBE_PREFIX = '〇'
+
+# Runs the specified form over a probe verb (dict_ending, is_ru_verb, is_whole_word),
+# returning the suffix that replaces dict_ending in every verb like it.
+def _probe_suffix(form, probe_verb):
+    (dict_ending, is_ru_verb, is_whole_word) = probe_verb
+    prefix = '' if is_whole_word else _PROBE_PREFIX
+    surface = form(VerbEntry(prefix + dict_ending, is_ru_verb))
+    if not surface.startswith(prefix):
+        raise ValueError(
+            'Expected ' + form.__name__ + ' to preserve verb prefix: ' + surface)
+    return surface[len(prefix):]
+
+# Adjective endings that _ADJECTIVE_FORM_RULES are expanded with,
+# as (dict_ending, adjective kind) where the kind is 'い' or 'な'.
+_ADJECTIVE_KINDS = ('い', 'な')
+
+# Derives rules for _compile_suffix_trie() by running each deinflectable form
+# over each probe verb, and by expanding _ADJECTIVE_FORM_RULES.
+# Each rule maps a conjugated suffix to the list of (dict_ending, word_class,
+# form_name) that produce it, where word_class is is_ru_verb for a verb or
+# the adjective kind for an adjective.
+# 
+# Verbs and adjectives share one trie, so one walk finds both.
+def _derive_deinflection_rules():
+    values_for_suffix = {}
+    for probe_verb in _PROBE_VERBS:
+        (dict_ending, is_ru_verb, is_whole_word) = probe_verb
+        for form in _DEINFLECTABLE_FORMS:
+            key = (_probe_suffix(form, probe_verb), is_whole_word)
+            values_for_suffix.setdefault(key, []).append(
+                (dict_ending, is_ru_verb, form.__name__))
+    for (form_name, (i_ending, na_ending)) in _ADJECTIVE_FORM_RULES.items():
+        adjective_rules = [(i_ending, 'い', 'い'), (na_ending, '', 'な')]
+        if not i_ending.startswith('い'):
+            adjective_rules.append(('よ' + i_ending, 'いい', 'い'))
+        for (suffix, dict_ending, kind) in adjective_rules:
+            values_for_suffix.setdefault((suffix, False), []).append(
+                (dict_ending, kind, form_name))
+    return [
+        (suffix, is_whole_word, values)
+        for ((suffix, is_whole_word), values) in values_for_suffix.items()
+    ]
+
+# Returns the trie of every deinflection rule.
+# 
+# Built on first use rather than at import, since deriving the rules
+# conjugates every probe verb in every form.
+@functools.lru_cache(maxsize=None)
+def _deinflection_trie():
+    return _compile_suffix_trie(_derive_deinflection_rules())
+
+# Returns whether the specified dictionary form could belong to a る-verb,
+# whose stem always ends with an い- or え-sound. (ex: みる, たべる)
+# A stem ending in kanji or katakana is given the benefit of the doubt.
+def _is_plausible_ru_verb(dict_verb):
+    c = dict_verb[-2]
+    if not ('ぁ' <= c <= 'ゖ'):
+        return True
+    romaji = _ROMAJI_FOR_KANA.get(c)
+    return romaji is not None and romaji[-1] in 'ie'
+
+# Returns a list of (dict_verb, is_ru_verb, form_name) for every single
+# verb form, and a list of (dict_adjective, is_na_adjective, form_name)
+# for every adjective form, that conjugates to the specified surface.
+# 
+# Every rule whose suffix matches the tail of the surface is tried,
+# and each candidate is confirmed by conjugating it forward again.
+def _deinflect_once(surface):
+    candidates = []
+    adjective_candidates = []
+    node = _deinflection_trie()
+    i = len(surface)
+    while i:
+        i -= 1
+        node = node.get(surface[i])
+        if node is None:
+            break
+        values = node.get(_TRIE_SUFFIX_VALUE)
+        if i == 0 and _TRIE_WORD_VALUE in node:
+            values = (values or []) + node[_TRIE_WORD_VALUE]
+        if values is None:
+            continue
+        prefix = surface[:i]
+        for (dict_ending, is_ru_verb, form_name) in values:
+            if is_ru_verb in _ADJECTIVE_KINDS:
+                _deinflect_adjective_once(
+                    surface, prefix + dict_ending, is_ru_verb, form_name,
+                    adjective_candidates)
+                continue
+            dict_verb = prefix + dict_ending
+            if len(dict_verb) < 2:
+                continue
+            if is_ru_verb and not _is_plausible_ru_verb(dict_verb):
+                continue
+            verb_entry = VerbEntry(dict_verb, is_ru_verb)
+            if is_ru_verb and verb_entry.conjugation_class != 'る-verb':
+                # Irregular or exceptional, so already found as an う-verb
+                continue
+            form = _DEINFLECTABLE_FORM_FOR_NAME[form_name]
+            try:
+                if form(verb_entry) != surface:
+                    continue
+            except ValueError:
+                continue
+            candidates.append((dict_verb, is_ru_verb, form_name))
+    return (candidates, adjective_candidates)
+
+def _deinflect_adjective_once(surface, dict_adjective, kind, form_name, candidates):
+    is_na_adjective = (kind == 'な')
+    if is_na_adjective and not dict_adjective:
+        return
+    if not is_na_adjective and len(dict_adjective) < 2:
+        return
+    try:
+        adjective_entry = AdjectiveEntry(dict_adjective, is_na_adjective)
+    except ValueError:
+        return
+    if conjugate_adjective(adjective_entry, form_name) == surface:
+        candidates.append((dict_adjective, is_na_adjective, form_name))
+
+# Given a conjugated verb, returns every (dict_verb, is_ru_verb, form_name)
+# that conjugates to it, sorted.
+# 
+# Chained forms are named by joining their parts with '+'.
+# (ex: 'たべられた' -> [..., ('たべる', True, 'passive+short_past_aff'), ...])
+def deinflect(surface):
+    return deinflect_word(surface)[0]
+
+# Given a conjugated adjective, returns every
+# (dict_adjective, is_na_adjective, form_name) that conjugates to it, sorted.
+# (ex: 'たかくなかった' -> [('たかい', False, 'short_past_neg')])
+def deinflect_adjective(surface):
+    return deinflect_word(surface)[1]
+
+# Given a conjugated verb or adjective, returns both what deinflect() and
+# what deinflect_adjective() would, as a pair, from a single walk of the trie.
+def deinflect_word(surface):
+    (verb_candidates, adjective_candidates) = _deinflect_once(surface)
+    candidates = set()
+    for candidate in verb_candidates:
+        candidates.add(candidate)
+        
+        (dict_verb, is_ru_verb, form_name) = candidate
+        if not is_ru_verb or form_name == 'short_present_aff':
+            continue
+        for (base_verb, base_is_ru_verb, base_form_name) in _deinflect_once(dict_verb)[0]:
+            if base_form_name in _RU_VERB_FORM_NAMES:
+                candidates.add(
+                    (base_verb, base_is_ru_verb, base_form_name + '+' + form_name))
+    return (sorted(candidates), sorted(adjective_candidates))
+
+
+# (form_name, probe_verb) -> (dict_ending_length, suffix)
+_REWRITE_FOR_PROBE_VERB = {}
+
+# Returns the probe verb (dict_ending, is_ru_verb, is_whole_word) whose
+# conjugations rewrite the same suffix as the specified verb's.
+def _probe_verb_for(dict_verb, is_ru_verb):
+    conjugation_class = _conjugation_class(dict_verb, is_ru_verb)
+    if conjugation_class == 'る-verb':
+        return ('る', True, False)
+    if len(conjugation_class) <= 1:
+        return (conjugation_class, False, False)
+    for probe_verb in _PROBE_VERBS:
+        (dict_ending, _, is_whole_word) = probe_verb
+        if len(dict_ending) >= 2 and (
+                dict_verb == dict_ending if is_whole_word else dict_verb.endswith(dict_ending)):
+            return probe_verb
+    raise AssertionError('No probe verb for conjugation class: ' + conjugation_class)
+
+
+# Given the name of a form, a sequence of dict-form verbs, and a parallel
+# sequence of is_ru_verb flags, returns the list of conjugated verbs.
+# 
+# Verbs are grouped by the suffix rewrite they need, and each rewrite is
+# derived once per form and then applied to its whole group at once.
+# Raises ValueError if any verb cannot be conjugated, or if there is
+# not exactly one flag per verb.
+def conjugate_many(form_name, verbs, is_ru_flags):
+    form = _form_for_name(form_name)
+    
+    verbs = list(verbs)
+    is_ru_flags = list(is_ru_flags)
+    if len(is_ru_flags) != len(verbs):
+        raise ValueError(
+            'Expected one is_ru_verb flag per verb: %d verbs, %d flags' % (
+                len(verbs), len(is_ru_flags)))
+    
+    # Group verbs by the last kana, or by their probe verb when the last kana
+    # alone does not determine the rewrite
+    indexes_for_key = {}
+    for (i, (dict_verb, is_ru_verb)) in enumerate(zip(verbs, is_ru_flags)):
+        key = dict_verb[-1:]
+        if key == 'る' or key == 'く':
+            key = _probe_verb_for(dict_verb, is_ru_verb)
+        indexes = indexes_for_key.get(key)
+        if indexes is None:
+            indexes_for_key[key] = indexes = []
+        indexes.append(i)
+    
+    results = [None] * len(verbs)
+    for (key, indexes) in indexes_for_key.items():
+        probe_verb = key if isinstance(key, tuple) else (key, False, False)
+        rewrite_key = (form_name, probe_verb)
+        rewrite = _REWRITE_FOR_PROBE_VERB.get(rewrite_key)
+        if rewrite is None:
+            try:
+                suffix = _probe_suffix(form, probe_verb)
+            except ValueError:
+                raise ValueError(
+                    'Expected verb in dictionary form: ' + verbs[indexes[0]])
+            rewrite = (len(probe_verb[0]), suffix)
+            _REWRITE_FOR_PROBE_VERB[rewrite_key] = rewrite
+        
+        (dict_ending_length, suffix) = rewrite
+        for i in indexes:
+            dict_verb = verbs[i]
+            results[i] = dict_verb[:len(dict_verb) - dict_ending_length] + suffix
+    return results
+
+
+# Given a verb entry, returns a dict of every form name -> conjugated verb.
+# 
+# The stem, て-form and short negative are computed only once and every
+# other form is derived from them, rather than calling each form in turn.
+# See _FORM_DEPENDENCIES, which this unrolls.
+def conjugate_all(verb_entry):
+    if type(verb_entry) is not VerbEntry:
+        verb_entry = VerbEntry.from_dict(verb_entry)
+    if _conjugate_all_cached is not None:
+        return dict(_conjugate_all_cached(verb_entry.dict_verb, verb_entry.is_ru_verb))
+    return _conjugate_all(verb_entry)
+
+def _conjugate_all(verb_entry):
+    stem_ = stem(verb_entry)
+    te_ = te(verb_entry)
+    short_present_neg_ = short_present_neg(verb_entry)
+    short_past_aff_ = _replace_vowel_suffix(te_, 'e', 'a')
+    return {
+        'stem': stem_,
+        'long_present_aff': stem_ + 'ます',
+        'long_present_neg': stem_ + 'ません',
+        'long_past_aff': stem_ + 'ました',
+        'long_past_neg': stem_ + 'ませんでした',
+        'short_present_aff': verb_entry.dict_verb,
+        'short_present_neg': short_present_neg_,
+        'short_past_aff': short_past_aff_,
+        'short_past_neg': short_present_neg_[:-1] + 'かった',
+        'tai': stem_ + 'たい',
+        'tari': short_past_aff_ + 'り',
+        'potential': potential(verb_entry),
+        'volitional': volitional(verb_entry),
+        'passive': passive(verb_entry),
+        'causative': causative(verb_entry),
+        'causative_passive': causative_passive(verb_entry),
+        'imperative': imperative(verb_entry),
+        'tara': short_past_aff_ + 'ら',
+        'ba': ba(verb_entry),
+        'chau': te_[:-1] + 'ちゃ',
+        'te': te_,
+        'te_neg': short_present_neg_[:-1] + 'くて',
+    }
+
+# LRU-cached version of _conjugate_all(), keyed by (dict_verb, is_ru_verb),
+# or None if the cache is disabled.
+_conjugate_all_cached = None
+
+# Enables a bounded LRU cache for conjugate_all(), discarding any
+# previous cache and its counters.
+# 
+# Useful when the same verbs are conjugated over and over, as when
+# conjugating every verb in running text.
+def enable_conjugate_all_cache(maxsize=65536):
+    global _conjugate_all_cached
     
-    if dict_verb[-1] in ['る']:
-        if verb_entry['is_ru_verb']:
-            return dict_verb[:-1] + 'て'
+    def conjugate_all_for_key(dict_verb, is_ru_verb):
+        return _conjugate_all(VerbEntry(dict_verb, is_ru_verb))
+    _conjugate_all_cached = functools.lru_cache(maxsize=maxsize)(conjugate_all_for_key)
+
+def disable_conjugate_all_cache():
+    global _conjugate_all_cached
+    _conjugate_all_cached = None
+
+# Returns the (hits, misses, maxsize, currsize) of the conjugate_all() cache,
+# or None if the cache is disabled.
+def conjugate_all_cache_info():
+    if _conjugate_all_cached is None:
+        return None
+    return _conjugate_all_cached.cache_info()
+
+
+# Attributes of a verb entry that the forms of conjugate_all() depend on.
+_VERB_ENTRY_INPUTS = ('dict_verb', 'conjugation_class')
+
+# What each form of conjugate_all() is computed from, in conjugate_all() order,
+# as form_name -> (dependencies, derive).
+# 
+# A form derived from another form depends on just that form, and
+# derive(surface of that form) returns its surface.
+# (ex: tari depends on short_past_aff, which depends on te)
+# 
+# Any other form depends on _VERB_ENTRY_INPUTS and is conjugated by
+# its own function, so derive is None.
+_FORM_DEPENDENCIES = {
+    'stem': (_VERB_ENTRY_INPUTS, None),
+    'long_present_aff': (('stem',), lambda stem_: stem_ + 'ます'),
+    'long_present_neg': (('stem',), lambda stem_: stem_ + 'ません'),
+    'long_past_aff': (('stem',), lambda stem_: stem_ + 'ました'),
+    'long_past_neg': (('stem',), lambda stem_: stem_ + 'ませんでした'),
+    'short_present_aff': (('dict_verb',), None),
+    'short_present_neg': (_VERB_ENTRY_INPUTS, None),
+    'short_past_aff': (('te',), lambda te_: _replace_vowel_suffix(te_, 'e', 'a')),
+    'short_past_neg': (('short_present_neg',), lambda short_present_neg_: short_present_neg_[:-1] + 'かった'),
+    'tai': (('stem',), lambda stem_: stem_ + 'たい'),
+    'tari': (('short_past_aff',), lambda short_past_aff_: short_past_aff_ + 'り'),
+    'potential': (_VERB_ENTRY_INPUTS, None),
+    'volitional': (_VERB_ENTRY_INPUTS, None),
+    'passive': (_VERB_ENTRY_INPUTS, None),
+    'causative': (_VERB_ENTRY_INPUTS, None),
+    'causative_passive': (_VERB_ENTRY_INPUTS, None),
+    'imperative': (_VERB_ENTRY_INPUTS, None),
+    'tara': (('short_past_aff',), lambda short_past_aff_: short_past_aff_ + 'ら'),
+    'ba': (_VERB_ENTRY_INPUTS, None),
+    'chau': (('te',), lambda te_: te_[:-1] + 'ちゃ'),
+    'te': (_VERB_ENTRY_INPUTS, None),
+    'te_neg': (('short_present_neg',), lambda short_present_neg_: short_present_neg_[:-1] + 'くて'),
+}
+
+# Returns the forms of _FORM_DEPENDENCIES ordered so that every form
+# comes after the forms it depends on.
+def _form_dependency_order():
+    order = []
+    def visit(form_name):
+        if form_name in order or form_name in _VERB_ENTRY_INPUTS:
+            return
+        for dependency in _FORM_DEPENDENCIES[form_name][0]:
+            visit(dependency)
+        order.append(form_name)
+    for form_name in _FORM_DEPENDENCIES:
+        visit(form_name)
+    return order
+
+_FORM_DEPENDENCY_ORDER = _form_dependency_order()
+
+# Returns, for each form of _FORM_DEPENDENCIES, the compiled form of
+# _FORM_RULES whose rules decide which verbs it accepts, following derived
+# forms back to the form they are derived from, or None if it accepts
+# every verb. (ex: 'tari' -> te, 'short_present_aff' -> None)
+def _validating_forms():
+    validating_form_for_name = {}
+    for form_name in _FORM_DEPENDENCY_ORDER:
+        (dependencies, derive) = _FORM_DEPENDENCIES[form_name]
+        if derive is not None:
+            validating_form_for_name[form_name] = validating_form_for_name[dependencies[0]]
+        elif dependencies == _VERB_ENTRY_INPUTS:
+            validating_form_for_name[form_name] = globals()[form_name]
         else:
-            return dict_verb[:-1] + 'って'
+            validating_form_for_name[form_name] = None
+    return validating_form_for_name
+
+_VALIDATING_FORM_FOR_NAME = _validating_forms()
+
+# Given a verb entry and the name of a form, returns whether the form can
+# conjugate the verb, from a set lookup on its conjugation class.
+# (ex: can_conjugate(VerbEntry('xyz', False), 'te') -> False)
+def can_conjugate(verb_entry, form_name):
+    if type(verb_entry) is not VerbEntry:
+        verb_entry = VerbEntry.from_dict(verb_entry)
+    if form_name not in _VALIDATING_FORM_FOR_NAME:
+        raise ValueError('Expected conjugation form: ' + form_name)
+    validating_form = _VALIDATING_FORM_FOR_NAME[form_name]
+    return (
+        validating_form is None or
+        verb_entry.conjugation_class in validating_form.conjugation_classes
+    )
+
+# Given a verb entry and the name of a form, returns the conjugated verb,
+# or None if the form cannot conjugate it, rather than raising ValueError.
+# 
+# Invalid verbs are rejected by can_conjugate() before conjugating,
+# so no exception or error message is built for them.
+def try_conjugate(verb_entry, form_name):
+    if type(verb_entry) is not VerbEntry:
+        verb_entry = VerbEntry.from_dict(verb_entry)
+    if not can_conjugate(verb_entry, form_name):
+        return None
+    return globals()[form_name](verb_entry)
+
+# Forms that follow each of _RU_VERB_FORM_NAMES in paradigm().
+_PARADIGM_CHAIN_FORM_NAMES = [
+    'long_present_aff',
+    'long_present_neg',
+    'long_past_aff',
+    'long_past_neg',
+    'short_present_neg',
+    'short_past_aff',
+    'short_past_neg',
+    'te',
+    'tara',
+    'ba',
+]
+
+# Given a verb entry, returns a dict of every form name -> conjugated verb,
+# including chains of each of _RU_VERB_FORM_NAMES followed by each of
+# _PARADIGM_CHAIN_FORM_NAMES. (ex: 'causative_passive+short_past_neg')
+# 
+# Each る-verb produced by the first form of a chain is conjugated with
+# conjugate_all() once, so its shared stem, て-form and short negative
+# are not recomputed for every chain.
+def paradigm(verb_entry):
+    forms = conjugate_all(verb_entry)
+    for derived_form_name in _RU_VERB_FORM_NAMES:
+        derived_forms = conjugate_all(VerbEntry(forms[derived_form_name], True))
+        for form_name in _PARADIGM_CHAIN_FORM_NAMES:
+            forms[derived_form_name + '+' + form_name] = derived_forms[form_name]
+    return forms
+
+# Given a verb entry and a chain of form names joined by '+', returns the
+# verb conjugated by each form in turn, as named by deinflect().
+# (ex: 'causative_passive+short_past_neg' -> 'たべさせられなかった')
+# 
+# Every form but the last must be one of _RU_VERB_FORM_NAMES,
+# whose output is conjugated further as a る-verb.
+# Intermediate verb entries are cached, so chains sharing a prefix reuse it.
+def conjugate_chain(verb_entry, chain):
+    if type(verb_entry) is not VerbEntry:
+        verb_entry = VerbEntry.from_dict(verb_entry)
+    form_names = chain.split('+')
+    for form_name in form_names[:-1]:
+        verb_entry = _derived_verb_entry(verb_entry, form_name)
+    return _form_for_name(form_names[-1])(verb_entry)
+
+@functools.lru_cache(maxsize=4096)
+def _derived_verb_entry(verb_entry, form_name):
+    if form_name not in _RU_VERB_FORM_NAMES:
+        raise ValueError('Expected form whose output is a る-verb: ' + form_name)
+    return VerbEntry(_form_for_name(form_name)(verb_entry), True)
+
+def _form_for_name(form_name):
+    form = globals().get(form_name)
+    if not hasattr(form, 'expects_verb_entry'):
+        raise ValueError('Expected conjugation form: ' + form_name)
+    return form
+
+
+# Given lines of a verb lexicon, yields a VerbEntry for each verb.
+# 
+# Each line holds one dict-form verb, optionally followed by + if it is a
+# る-verb or - if it is an う-verb. (ex: 'たべる+', 'かえる-', 'かく')
+# The class of a verb that is not marked is guessed by guess_is_ru_verb(),
+# and the verb is yielded as both only if it could be either. (ex: かえる)
+def read_lexicon(lines):
+    for line in lines:
+        descriptor = line.strip()
+        if not descriptor or descriptor.startswith('#'):
+            continue
+        if descriptor[-1] in '+＋':
+            yield VerbEntry(descriptor[:-1], True)
+        elif descriptor[-1] in '-ー':
+            yield VerbEntry(descriptor[:-1], False)
+        else:
+            yield from _verb_entries_for(descriptor)
+
+
+# An in-memory table of every form of every verb entry in a lexicon,
+# which is kept up to date as entries are added, removed, or corrected,
+# rather than regenerated.
+# 
+# Each change returns a diff of the surfaces that changed, as a list of
+# (form_name, old_surface, new_surface), where old_surface or new_surface
+# is None for a form that was added or removed.
+# 
+# Like conjugate_all(), every method accepts a VerbEntry or a dict.
+# A ConjugationIndex cannot be changed in place, but build_index(table, path)
+# writes a new one from the table's entries.
+class ConjugationTable:
+    def __init__(self, verb_entries=()):
+        self._forms_for_entry = {}
+        self._keys_for_surface = {}  # surface -> set of (dict_verb, is_ru_verb, form_name)
+        for verb_entry in verb_entries:
+            self.add(verb_entry)
+    
+    def __len__(self):
+        return len(self._forms_for_entry)
+    
+    def __contains__(self, verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        return verb_entry in self._forms_for_entry
     
-    if dict_verb[-1] in ['う', 'つ', 'る']:
-        return dict_verb[:-1] + 'って'
-    if dict_verb[-1] in ['む', 'ぶ', 'ぬ']:
-        return dict_verb[:-1] + 'んで'
-    if dict_verb[-1] in ['く']:
-        return dict_verb[:-1] + 'いて'
-    if dict_verb[-1] in ['ぐ']:
-        return dict_verb[:-1] + 'いで'
-    if dict_verb[-1] in ['す']:
-        return dict_verb[:-1] + 'して'
+    def __iter__(self):
+        return iter(self._forms_for_entry)
     
-    raise ValueError(
-        'Expected verb in dictionary form: ' + dict_verb)
+    # Adds every form of verb_entry, if it is not already in the table.
+    # Raises ValueError if the verb cannot be conjugated.
+    def add(self, verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        if verb_entry in self._forms_for_entry:
+            return []
+        forms = _conjugate_all(verb_entry)
+        self._forms_for_entry[verb_entry] = forms
+        self._index(verb_entry, forms.items())
+        return [(form_name, None, surface) for (form_name, surface) in forms.items()]
+    
+    # Removes every form of verb_entry.
+    # Raises KeyError if it is not in the table.
+    def remove(self, verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        forms = self._forms_for_entry.pop(verb_entry)
+        self._unindex(verb_entry, forms.items())
+        return [(form_name, surface, None) for (form_name, surface) in forms.items()]
+    
+    # Replaces old_entry with new_entry, such as when a verb's class is
+    # corrected, returning only the forms whose surfaces differ.
+    # 
+    # Every form depends on the conjugation class, so all of them are
+    # recomputed with _conjugate_all(), which is faster than working out
+    # which ones could have changed.
+    # Raises KeyError if old_entry is not in the table, or ValueError
+    # if new_entry already is or cannot be conjugated.
+    def update(self, old_entry, new_entry):
+        if type(old_entry) is not VerbEntry:
+            old_entry = VerbEntry.from_dict(old_entry)
+        if type(new_entry) is not VerbEntry:
+            new_entry = VerbEntry.from_dict(new_entry)
+        old_forms = self._forms_for_entry[old_entry]
+        if new_entry == old_entry:
+            return []
+        if new_entry in self._forms_for_entry:
+            raise ValueError('Already in table: ' + repr(new_entry))
+        forms = _conjugate_all(new_entry)
+        diff = [
+            (form_name, old_forms[form_name], surface)
+            for (form_name, surface) in forms.items()
+            if surface != old_forms[form_name]
+        ]
+        
+        del self._forms_for_entry[old_entry]
+        self._forms_for_entry[new_entry] = forms
+        self._unindex(old_entry, old_forms.items())
+        self._index(new_entry, forms.items())
+        return diff
+    
+    # Given a verb entry, returns a dict of every form name -> conjugated verb,
+    # as conjugate_all() would.
+    def forms(self, verb_entry):
+        if type(verb_entry) is not VerbEntry:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        forms = self._forms_for_entry[verb_entry]
+        return {form_name: forms[form_name] for form_name in _FORM_DEPENDENCIES}
+    
+    # Given a conjugated verb, returns every (dict_verb, is_ru_verb, form_name)
+    # in the table that conjugates to it, sorted.
+    def lookup(self, surface):
+        return sorted(self._keys_for_surface.get(surface, ()))
+    
+    def _index(self, verb_entry, form_items):
+        (dict_verb, is_ru_verb) = (verb_entry.dict_verb, verb_entry.is_ru_verb)
+        keys_for_surface = self._keys_for_surface
+        for (form_name, surface) in form_items:
+            keys = keys_for_surface.get(surface)
+            if keys is None:
+                keys_for_surface[surface] = keys = set()
+            keys.add((dict_verb, is_ru_verb, form_name))
+    
+    def _unindex(self, verb_entry, form_items):
+        (dict_verb, is_ru_verb) = (verb_entry.dict_verb, verb_entry.is_ru_verb)
+        keys_for_surface = self._keys_for_surface
+        for (form_name, surface) in form_items:
+            keys = keys_for_surface[surface]
+            keys.discard((dict_verb, is_ru_verb, form_name))
+            if not keys:
+                del keys_for_surface[surface]
 
 
-# Observed in wild, and explained on:
-# http://www.guidetojapanese.org/learn/grammar/compound
-@expects_verb_entry
-def te_neg(verb_entry):
-    return short_present_neg(verb_entry)[:-1] + 'くて'
+# On-disk index of every conjugation of every verb in a lexicon.
+# 
+# The file starts with two header lines:
+# * nhconj-index <version> <surface section offset> <verb section offset>
+# * <form name> <form name> ...
+# 
+# These are followed by two sections of sorted, tab-separated lines:
+# * surface section: <surface> <dict_verb> <is_ru_verb: 1 or 0> <form number>
+# * verb section:    <dict_verb> <is_ru_verb> <surface> <surface> ...
+# 
+# A form number is a position in the header's list of form names, and the
+# surfaces of the verb section follow that same order.
+# 
+# Lookups binary-search the memory-mapped file directly, so opening an
+# index does not read it into memory.
+_INDEX_MAGIC = b'nhconj-index'
+_INDEX_VERSION = b'1'
+_INDEX_HEADER_FORMAT = b'%s\t%s\t%016d\t%016d\n'
+_INDEX_HEADER_SIZE = len(_INDEX_HEADER_FORMAT % (_INDEX_MAGIC, _INDEX_VERSION, 0, 0))
+
+# Lines sorted in memory at once while building an index,
+# before being spilled to a temporary file.
+_INDEX_SORT_RUN_SIZE = 1000000
+
+# Conjugates every verb entry into every form, writing an index to path
+# that can be opened with ConjugationIndex.
+# 
+# Memory use is bounded: lines are sorted in runs of _INDEX_SORT_RUN_SIZE
+# and then merged from temporary files.
+# Raises ValueError if any verb cannot be conjugated.
+def build_index(verb_entries, path):
+    import tempfile
+    
+    form_names = None
+    with tempfile.TemporaryDirectory(prefix='nhconj-index-') as temp_dir:
+        surface_runs = []
+        verb_runs = []
+        surface_lines = []
+        verb_lines = []
+        for verb_entry in verb_entries:
+            forms = conjugate_all(verb_entry)
+            if form_names is None:
+                form_names = list(forms)
+            
+            dict_verb = verb_entry.dict_verb.encode('utf-8')
+            is_ru_verb = b'1' if verb_entry.is_ru_verb else b'0'
+            surfaces = [forms[form_name].encode('utf-8') for form_name in form_names]
+            for (form_number, surface) in enumerate(surfaces):
+                surface_lines.append(b'%s\t%s\t%s\t%d\n' % (
+                    surface, dict_verb, is_ru_verb, form_number))
+            verb_lines.append(b'\t'.join([dict_verb, is_ru_verb] + surfaces) + b'\n')
+            
+            if len(surface_lines) >= _INDEX_SORT_RUN_SIZE:
+                surface_runs.append(_write_sorted_run(surface_lines, temp_dir))
+                verb_runs.append(_write_sorted_run(verb_lines, temp_dir))
+                surface_lines = []
+                verb_lines = []
+        surface_runs.append(_write_sorted_run(surface_lines, temp_dir))
+        verb_runs.append(_write_sorted_run(verb_lines, temp_dir))
+        if form_names is None:
+            form_names = list(conjugate_all(VerbEntry('する', False)))
+        
+        with open(path, 'wb') as f:
+            f.write(b'\0' * _INDEX_HEADER_SIZE)
+            f.write('\t'.join(form_names).encode('utf-8') + b'\n')
+            surface_start = f.tell()
+            _merge_sorted_runs(surface_runs, f)
+            verb_start = f.tell()
+            _merge_sorted_runs(verb_runs, f)
+            f.seek(0)
+            f.write(_INDEX_HEADER_FORMAT % (
+                _INDEX_MAGIC, _INDEX_VERSION, surface_start, verb_start))
+
+def _write_sorted_run(lines, temp_dir):
+    import tempfile
+    
+    lines.sort()
+    with tempfile.NamedTemporaryFile('wb', dir=temp_dir, delete=False) as f:
+        f.writelines(lines)
+        return f.name
+
+# Merges sorted files of lines into f, dropping duplicate lines.
+def _merge_sorted_runs(run_paths, f):
+    import heapq
+    
+    runs = [open(run_path, 'rb') for run_path in run_paths]
+    try:
+        last_line = None
+        for line in heapq.merge(*runs):
+            if line != last_line:
+                f.write(line)
+                last_line = line
+    finally:
+        for run in runs:
+            run.close()
+
+
+# A read-only view of an index file written by build_index().
+class ConjugationIndex:
+    def __init__(self, path):
+        import mmap
+        
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self._mmap[:_INDEX_HEADER_SIZE].split(b'\t')
+        if header[:2] != [_INDEX_MAGIC, _INDEX_VERSION]:
+            self._mmap.close()
+            raise ValueError('Expected nhconj index file: ' + path)
+        self._surface_start = int(header[2])
+        self._verb_start = int(header[3])
+        self.form_names = self._mmap[_INDEX_HEADER_SIZE:self._surface_start - 1] \
+            .decode('utf-8').split('\t')
+    
+    def close(self):
+        self._mmap.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    # Given a conjugated verb, returns every (dict_verb, is_ru_verb, form_name)
+    # in the index that conjugates to it.
+    def lookup(self, surface):
+        form_names = self.form_names
+        return [
+            (dict_verb, is_ru_verb == '1', form_names[int(form_number)])
+            for (dict_verb, is_ru_verb, form_number) in self._find(
+                self._surface_start, self._verb_start, surface)
+        ]
+    
+    # Given a dict-form verb, returns every (is_ru_verb, form_name, surface)
+    # in the index for it.
+    def forms(self, dict_verb):
+        results = []
+        for (is_ru_verb, *surfaces) in self._find(self._verb_start, len(self._mmap), dict_verb):
+            for (form_name, surface) in zip(self.form_names, surfaces):
+                results.append((is_ru_verb == '1', form_name, surface))
+        return results
+    
+    # Given a dict-form verb and a form name (ex: 'te'), returns every
+    # (is_ru_verb, surface) in the index for it.
+    def conjugate(self, dict_verb, form_name):
+        i = self.form_names.index(form_name) + 1
+        return [
+            (fields[0] == '1', fields[i])
+            for fields in self._find(self._verb_start, len(self._mmap), dict_verb)
+        ]
+    
+    # Returns the remaining fields of every line in [start, end) whose
+    # first field is key.
+    def _find(self, start, end, key):
+        mm = self._mmap
+        target = key.encode('utf-8') + b'\t'
+        
+        # Binary search for the first line >= target
+        lo = start
+        hi = end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = mm.rfind(b'\n', lo, mid) + 1 or lo
+            line_end = mm.find(b'\n', line_start, hi) + 1
+            if mm[line_start:line_end] < target:
+                lo = line_end
+            else:
+                hi = line_start
+        
+        results = []
+        while lo < end:
+            line_end = mm.find(b'\n', lo, end) + 1
+            line = mm[lo:line_end]
+            if not line.startswith(target):
+                break
+            results.append(line[len(target):-1].decode('utf-8').split('\t'))
+            lo = line_end
+        return results
+
+
+# Yields every suffix that has a rule in the specified trie,
+# written from left to right.
+def _trie_suffixes(trie, suffix=''):
+    if suffix and (_TRIE_SUFFIX_VALUE in trie or _TRIE_WORD_VALUE in trie):
+        yield suffix
+    for (key, child) in trie.items():
+        if key not in [_TRIE_SUFFIX_VALUE, _TRIE_WORD_VALUE]:
+            yield from _trie_suffixes(child, key + suffix)
+
+# Compiles patterns into an Aho-Corasick automaton (goto, fail, lengths),
+# whose states are list indexes and whose start state is 0:
+# * goto[state] maps a character to the next state.
+# * fail[state] is the state to fall back to when goto[state] has no entry.
+# * lengths[state] holds the length of every pattern that ends at state.
+def _compile_aho_corasick(patterns):
+    goto = [{}]
+    lengths = [()]
+    for pattern in patterns:
+        state = 0
+        for c in pattern:
+            next_state = goto[state].get(c)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][c] = next_state
+                goto.append({})
+                lengths.append(())
+            state = next_state
+        lengths[state] += (len(pattern),)
+    
+    # Breadth-first, so that every fail state is finished before it is used
+    fail = [0] * len(goto)
+    queue = collections.deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for (c, child) in goto[state].items():
+            queue.append(child)
+            f = fail[state]
+            while f and c not in goto[f]:
+                f = fail[f]
+            fail[child] = goto[f].get(c, 0)
+            lengths[child] += lengths[fail[child]]
+    return (goto, fail, lengths)
+
+# Returns the Aho-Corasick automaton used by scan(), built on first use.
+@functools.lru_cache(maxsize=None)
+def _scan_automaton():
+    return _compile_aho_corasick(sorted(set(_trie_suffixes(_deinflection_trie()))))
+
+# Most hiragana allowed between a span's kanji and the start of the
+# suffix that is rewritten by deinflect(). (ex: 食[べられな]かった)
+_SCAN_MAX_OKURIGANA = 4
+
+# Most hiragana after the kanji of a candidate's dictionary form.
+# Longer candidates are mostly a verb followed by an auxiliary verb,
+# which is found as the shorter verb instead. (ex: 読んでいる -> 読んで)
+_SCAN_MAX_DICT_OKURIGANA = 3
+
+# Most kanji kept at the start of a span. Longer runs keep only their tail.
+_SCAN_MAX_KANJI = 8
+
+_SCAN_CHUNK_SIZE = 1 << 16
+
+# Returns the length of the longest suffix matched by _scan_automaton().
+@functools.lru_cache(maxsize=None)
+def _scan_max_suffix_length():
+    return max(max(lengths) for lengths in _scan_automaton()[2] if lengths)
+
+# Spans whose candidates are remembered during one scan().
+# Running text repeats the same few verbs, so most spans are cache hits.
+_SCAN_CACHE_SIZE = 4096
+
+# Returns the candidates of deinflect(span) whose dictionary form has at most
+# _SCAN_MAX_DICT_OKURIGANA hiragana after the first kanji_length characters.
+def _scan_candidates(span, kanji_length):
+    return tuple(
+        candidate for candidate in deinflect(span)
+        if len(candidate[0]) - kanji_length <= _SCAN_MAX_DICT_OKURIGANA
+    )
+
+# Given a stream of Japanese text, yields (offset, surface, candidates) for
+# every conjugated verb found, where offset is the character offset of the
+# surface and candidates are as returned by deinflect(surface).
+# 
+# A span starts with a run of kanji, followed by hiragana. Its end is found
+# with one pass of an Aho-Corasick automaton over the suffixes of every
+# deinflection rule, and only ends where some rule matches are checked with
+# deinflect(). The longest span that deinflects is yielded.
+# (ex: 食べられなかった, but not 食べられ or 食べ)
+# 
+# Candidates are filtered to those whose dictionary form has at most
+# _SCAN_MAX_DICT_OKURIGANA hiragana after its kanji.
+# 
+# Verbs written entirely in kana are not found, since nothing marks where
+# they start.
+# 
+# The stream is read chunk_size characters at a time, and at most one span
+# plus a bounded cache of recent spans is held in memory, so memory use is
+# independent of the length of the stream.
+def scan(in_stream, chunk_size=_SCAN_CHUNK_SIZE):
+    (goto, fail, lengths) = _scan_automaton()
+    max_hiragana = _SCAN_MAX_OKURIGANA + _scan_max_suffix_length()
+    candidates_for = functools.lru_cache(maxsize=_SCAN_CACHE_SIZE)(_scan_candidates)
+    state = 0
+    offset = 0
+    span_start = None  # offset of the current span, if any
+    kana_start = None  # offset of the first hiragana in the current span, if any
+    span = ''
+    best = None
+    while True:
+        chunk = in_stream.read(chunk_size)
+        if not chunk:
+            break
+        for c in chunk:
+            if '一' <= c <= '鿿' or c == '々':
+                if span_start is None or kana_start is not None:
+                    if best is not None:
+                        yield best
+                        best = None
+                    span_start = offset
+                    kana_start = None
+                    span = c
+                elif len(span) < _SCAN_MAX_KANJI:
+                    span += c
+                else:
+                    span = span[1:] + c
+                    span_start += 1
+            elif span_start is not None:
+                if 'ぁ' <= c <= 'ゖ' and c != 'を':
+                    if kana_start is None:
+                        kana_start = offset
+                    if offset - kana_start < max_hiragana:
+                        span += c
+                    else:
+                        span_start = None
+                else:
+                    span_start = None
+                if span_start is None and best is not None:
+                    yield best
+                    best = None
+            
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            offset += 1
+            
+            if span_start is not None and lengths[state]:
+                # Does the longest match start inside the span, close enough to its kanji?
+                match_start = offset - max(lengths[state])
+                if match_start >= span_start and (
+                        kana_start is None or
+                        match_start - kana_start <= _SCAN_MAX_OKURIGANA):
+                    kanji_length = len(span) if kana_start is None else kana_start - span_start
+                    candidates = candidates_for(span, kanji_length)
+                    if candidates:
+                        best = (span_start, span, list(candidates))
+    if best is not None:
+        yield best
+
+
+# ------------------------------------------------------------------------------
+# Instrumentation
+
+# While instrumentation is enabled, each instrumented function is replaced in
+# the module's globals by a wrapper that records its statistics. Callers
+# inside this module look functions up by name on every call, so they go
+# through the wrappers too. (ex: te() -> _replace_vowel_suffix())
+# 
+# While disabled, the original functions are in place and cost nothing extra.
+
+# Function name -> the original function, while instrumentation is enabled.
+_uninstrumented = {}
+
+# Function name -> statistics, as a dict of the form
+# {'calls': n, 'seconds': s, 'branches': Counter, 'exceptions': Counter}.
+_instrumentation_stats = {}
+
+# Returns a label for the rule branch that a conjugator will take for
+# the specified verb entry. (ex: 'う-verb:く')
+def _verb_entry_branch(verb_entry, *args):
+    if type(verb_entry) is not VerbEntry:
+        try:
+            verb_entry = VerbEntry.from_dict(verb_entry)
+        except Exception:
+            return 'invalid'
+    if len(verb_entry.conjugation_class) == 1:
+        return 'う-verb:' + verb_entry.conjugation_class
+    return verb_entry.conjugation_class
+
+# Returns a label for the rule in _UNTE_RULES that unte() will apply
+# to the specified て-form, or 'none' if no rule matches.
+def _unte_branch(te_form):
+    node = _UNTE_TRIE
+    branch = 'none'
+    i = len(te_form)
+    while i:
+        i -= 1
+        node = node.get(te_form[i])
+        if node is None:
+            break
+        if _TRIE_SUFFIX_VALUE in node:
+            if i == 0 and _has_empty_stem(node[_TRIE_SUFFIX_VALUE][0]):
+                branch = 'none'
+            else:
+                branch = te_form[i:]
+        if i == 0 and _TRIE_WORD_VALUE in node:
+            branch = te_form + ' (whole word)'
+    return branch
+
+def _replace_vowel_suffix_branch(dict_verb, old_vowel, new_vowel):
+    return old_vowel + '->' + new_vowel
+
+# Functions that are not conjugators but are instrumented, along with
+# a function that labels the rule branch taken for a call, if any.
+_INSTRUMENTED_HELPERS = {
+    'unte': _unte_branch,
+    'deinflect': None,
+    'conjugate_all': _verb_entry_branch,
+    'conjugate_many': None,
+    '_replace_vowel_suffix': _replace_vowel_suffix_branch,
+    'shift_vowel': None,
+    'guess_is_ru_verb': None,
+    'romaji': None,
+    'unromaji': None,
+}
+
+def _instrument(name, func, branch_for):
+    stats = _instrumentation_stats.setdefault(name, {
+        'calls': 0,
+        'seconds': 0.0,
+        'branches': collections.Counter(),
+        'exceptions': collections.Counter(),
+    })
+    branches = stats['branches']
+    exceptions = stats['exceptions']
+    perf_counter = time.perf_counter
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats['calls'] += 1
+        if branch_for is not None:
+            branches[branch_for(*args)] += 1
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            exceptions[type(e).__name__] += 1
+            raise
+        finally:
+            stats['seconds'] += perf_counter() - start
+    return wrapper
+
+# Starts recording call counts, cumulative time, rule branch hit counts, and
+# exception counts for every conjugator and for the functions in
+# _INSTRUMENTED_HELPERS. Statistics from earlier runs are kept.
+# 
+# Only calls in this process are recorded, so not those made by worker
+# processes of run_batch().
+def enable_instrumentation():
+    if _uninstrumented:
+        return
+    module_globals = globals()
+    for (name, value) in list(module_globals.items()):
+        if hasattr(value, 'expects_verb_entry'):
+            branch_for = _verb_entry_branch
+        elif name in _INSTRUMENTED_HELPERS:
+            branch_for = _INSTRUMENTED_HELPERS[name]
+        else:
+            continue
+        _uninstrumented[name] = value
+        module_globals[name] = _instrument(name, value, branch_for)
+
+# Stops recording statistics, restoring the original functions.
+def disable_instrumentation():
+    globals().update(_uninstrumented)
+    _uninstrumented.clear()
+
+# Discards all recorded statistics.
+def reset_instrumentation():
+    for stats in _instrumentation_stats.values():
+        stats['calls'] = 0
+        stats['seconds'] = 0.0
+        stats['branches'].clear()
+        stats['exceptions'].clear()
+
+# Returns a copy of the statistics recorded so far, as a dict of
+# function name -> {'calls': n, 'seconds': s, 'branches': {...}, 'exceptions': {...}}.
+# Functions that were never called are omitted.
+def instrumentation_stats():
+    return {
+        name: {
+            'calls': stats['calls'],
+            'seconds': stats['seconds'],
+            'branches': dict(stats['branches']),
+            'exceptions': dict(stats['exceptions']),
+        }
+        for (name, stats) in sorted(_instrumentation_stats.items())
+        if stats['calls']
+    }
+
+# Writes the statistics recorded so far to path,
+# either as JSON or in the Prometheus text exposition format.
+def dump_instrumentation(path, output_format='json'):
+    stats = instrumentation_stats()
+    with open(path, 'w', encoding='utf-8') as f:
+        if output_format == 'json':
+            import json
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        elif output_format == 'prometheus':
+            f.write(_format_prometheus(stats))
+        else:
+            raise ValueError('Unknown instrumentation format: ' + output_format)
+
+def _format_prometheus(stats):
+    lines = []
+    def metric(name, metric_type, help_text, samples):
+        lines.append('# HELP nhconj_' + name + ' ' + help_text)
+        lines.append('# TYPE nhconj_' + name + ' ' + metric_type)
+        for (labels, value) in samples:
+            lines.append('nhconj_' + name + '{' + ','.join(
+                key + '="' + _escape_prometheus_label(label) + '"'
+                for (key, label) in labels
+            ) + '} ' + repr(value))
+    
+    metric('calls_total', 'counter', 'Calls of each function.', [
+        ((('function', name),), s['calls'])
+        for (name, s) in stats.items()
+    ])
+    metric('seconds_total', 'counter', 'Cumulative time spent in each function.', [
+        ((('function', name),), s['seconds'])
+        for (name, s) in stats.items()
+    ])
+    metric('branch_hits_total', 'counter', 'Calls of each function by rule branch.', [
+        ((('function', name), ('branch', branch)), count)
+        for (name, s) in stats.items()
+        for (branch, count) in sorted(s['branches'].items())
+    ])
+    metric('exceptions_total', 'counter', 'Exceptions raised by each function.', [
+        ((('function', name), ('exception', exception)), count)
+        for (name, s) in stats.items()
+        for (exception, count) in sorted(s['exceptions'].items())
+    ])
+    return '\n'.join(lines) + '\n'
+
+def _escape_prometheus_label(label):
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# ------------------------------------------------------------------------------
+# Server
+
+# Serves conjugation over a line-delimited JSON protocol.
+# 
+# Each request line is {"id": ..., "command": <batch command>, "word": ...},
+# and is answered by one line, in request order per connection:
+# * {"id": ..., "results": [[<is_ru_verb or null>, <result>], ...]}, or
+# * {"id": ..., "error": "<error>"}
+# 
+# Requests from every connection that arrive while a batch is being
+# processed are grouped by command into the next batch.
+# 
+# Backpressure: once max_pending requests are waiting to be batched,
+# or a connection has max_pending_per_connection responses that its client
+# has not read yet, the server stops reading more requests.
+class ConjugationServer:
+    def __init__(self, max_batch_size=1000, max_pending=10000, max_pending_per_connection=1000):
+        import asyncio
+        import json
+        
+        # Bound once here rather than imported for every request
+        self._json_loads = json.loads
+        self._json_dumps = json.dumps
+        self._max_batch_size = max_batch_size
+        self._max_pending_per_connection = max_pending_per_connection
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._server = None
+        self._batch_task = None
+        self.batch_count = 0
+        self.request_count = 0
+    
+    # Starts listening on 'tcp:<host>:<port>' or 'unix:<path>'.
+    async def start(self, address):
+        import asyncio
+        
+        (kind, _, location) = address.partition(':')
+        if kind == 'unix':
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path=location)
+        elif kind == 'tcp':
+            (host, _, port) = location.rpartition(':')
+            self._server = await asyncio.start_server(
+                self._handle_connection, host or None, int(port))
+        else:
+            raise ValueError('Expected tcp:<host>:<port> or unix:<path>: ' + address)
+        self._batch_task = asyncio.create_task(self._run_batches())
+    
+    async def serve_forever(self):
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+    
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batch_task.cancel()
+    
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        responses = asyncio.Queue(maxsize=self._max_pending_per_connection)
+        write_task = asyncio.create_task(self._write_responses(responses, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # line too long, or reset
+                    break
+                if not line or write_task.done():  # client went away
+                    break
+                await responses.put(await self._submit(line, loop))
+        finally:
+            if not write_task.done():
+                await responses.put(None)
+            await write_task
+    
+    # Queues the request on the specified line for the next batch,
+    # returning (request_id, future of (results, error)).
+    async def _submit(self, line, loop):
+        future = loop.create_future()
+        try:
+            request = self._json_loads(line)
+            request_id = request.get('id')
+            command = request['command']
+            word = request['word']
+        except (ValueError, KeyError, TypeError, AttributeError):
+            future.set_result((None, 'ValueError: Expected JSON request: ' + repr(line)))
+            return (None, future)
+        if command not in _BATCH_COMMANDS or not isinstance(word, str):
+            future.set_result((None, 'ValueError: Expected batch command and word'))
+            return (request_id, future)
+        
+        await self._queue.put((command, word, future))
+        return (request_id, future)
+    
+    async def _write_responses(self, responses, writer):
+        json_dumps = self._json_dumps
+        try:
+            while True:
+                item = await responses.get()
+                if item is None:
+                    break
+                (request_id, future) = item
+                (results, error) = await future
+                if error is None:
+                    response = { 'id': request_id, 'results': results }
+                else:
+                    response = { 'id': request_id, 'error': error }
+                writer.write(json_dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            # Unblock _handle_connection() if it is waiting to queue more
+            while not responses.empty():
+                responses.get_nowait()
+    
+    async def _run_batches(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self._max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            self._run_batch(batch)
+    
+    def _run_batch(self, batch):
+        requests_for_command = {}
+        for request in batch:
+            requests_for_command.setdefault(request[0], []).append(request)
+        for (command, requests) in requests_for_command.items():
+            records = _run_batch_chunk(command, [word for (_, word, _) in requests])
+            for ((_, _, future), (_, results, error)) in zip(requests, records):
+                if not future.cancelled():
+                    future.set_result((results, error))
+        self.batch_count += 1
+        self.request_count += len(batch)
+
+# Serves conjugation on the specified address until cancelled.
+# See ConjugationServer.
+async def serve(address):
+    server = ConjugationServer()
+    await server.start(address)
+    await server.serve_forever()
+
+# Runs the named command on each line of in_stream and writes the results
+# as run_batch() would, but on the ConjugationServer at address rather than
+# in this process, so that many short runs share one warm process.
+# 
+# If nothing is listening on a unix:<path> address then a server is started
+# there first, in the background. It keeps running for later runs
+# until it is killed.
+# 
+# Words are sent chunk_size at a time, and every response to a chunk is read
+# before the next chunk is sent, so at most _MAX_REMOTE_CHUNK_SIZE words
+# are sent at once.
+def run_remote_batch(address, command, in_stream, out_stream, err_stream,
+        output_format='tsv', chunk_size=None):
+    import json
+    
+    if command not in _BATCH_COMMANDS:
+        raise ValueError('Expected batch command: ' + command)
+    if output_format not in _BATCH_OUTPUT_FORMATS:
+        raise ValueError('Expected batch output format: ' + output_format)
+    write_row = _batch_row_writer(output_format)
+    chunk_size = min(chunk_size or _DEFAULT_CHUNK_SIZE, _MAX_REMOTE_CHUNK_SIZE)
+    
+    words = (word for word in (line.strip() for line in in_stream) if word)
+    chunks = iter(lambda: list(itertools.islice(words, chunk_size)), [])
+    error_count = 0
+    with _connect(address, start_server=True) as sock:
+        with sock.makefile('rb') as responses:
+            for chunk in chunks:
+                sock.sendall(b''.join(
+                    json.dumps({ 'id': i, 'command': command, 'word': word },
+                        ensure_ascii=False).encode('utf-8') + b'\n'
+                    for (i, word) in enumerate(chunk)))
+                for word in chunk:
+                    line = responses.readline()
+                    if not line:
+                        raise ConnectionError('Server closed connection: ' + address)
+                    response = json.loads(line)
+                    if 'error' in response:
+                        err_stream.write(word + '\t' + response['error'] + '\n')
+                        error_count += 1
+                        continue
+                    for (is_ru_verb, result) in response['results']:
+                        write_row(out_stream, word, result, is_ru_verb)
+    return error_count
+
+# Most requests that run_remote_batch() sends before reading their responses.
+# A server stops reading requests from a connection whose client is not
+# reading responses, so this must not exceed max_pending_per_connection.
+_MAX_REMOTE_CHUNK_SIZE = 1000
+
+# Seconds that _connect() waits for a server that it started to listen.
+_SERVER_START_TIMEOUT = 10
+
+# Returns a socket connected to the server at address,
+# which is 'tcp:<host>:<port>' or 'unix:<path>'.
+# 
+# If start_server is true and nothing is listening on a unix:<path> address,
+# starts a server there that outlives this process.
+def _connect(address, start_server=False):
+    import socket
+    
+    (kind, _, location) = address.partition(':')
+    if kind == 'unix':
+        def connect():
+            sock = socket.socket(socket.AF_UNIX)
+            try:
+                sock.connect(location)
+            except OSError:
+                sock.close()
+                raise
+            return sock
+    elif kind == 'tcp':
+        (host, _, port) = location.rpartition(':')
+        def connect():
+            return socket.create_connection((host or 'localhost', int(port)))
+    else:
+        raise ValueError('Expected tcp:<host>:<port> or unix:<path>: ' + address)
+    
+    try:
+        return connect()
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not start_server or kind != 'unix':
+            raise
+    _start_server_process(address)
+    deadline = time.monotonic() + _SERVER_START_TIMEOUT
+    while True:
+        try:
+            return connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.01)
+
+# Starts `nhconj.py --serve <address>` in the background, in its own session
+# so that it is not stopped along with the shell pipeline that started it.
+def _start_server_process(address):
+    import subprocess
+    
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', address],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
 
 # ------------------------------------------------------------------------------
 # CLI
 
-def main():
+# Parses an argparse option value that must be an integer of at least 0.
+def _non_negative_int(text):
+    return _int_of_at_least(text, 0)
+
+# Parses an argparse option value that must be an integer of at least 1.
+def _positive_int(text):
+    return _int_of_at_least(text, 1)
+
+def _int_of_at_least(text, minimum):
+    import argparse
+    
+    try:
+        value = int(text)
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        raise argparse.ArgumentTypeError(
+            'expected an integer of at least %d: %r' % (minimum, text))
+    return value
+
+def main(args=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description='Conjugates Japanese verbs and adjectives.')
+    parser.add_argument('--batch', metavar='COMMAND',
+        help='run COMMAND on each line of stdin instead of prompting')
+    parser.add_argument('--scan', action='store_true',
+        help='find and deinflect every conjugated verb in the document on stdin')
+    parser.add_argument('--format', choices=['tsv', 'jsonl'], default='tsv',
+        help='output format for --batch or --scan (default: tsv)')
+    parser.add_argument('--errors', metavar='PATH',
+        help='write --batch errors to PATH instead of stderr')
+    parser.add_argument('--workers', type=_non_negative_int, default=1, metavar='N',
+        help='run --batch in N processes, or 0 for one per CPU (default: 1)')
+    parser.add_argument('--chunk-size', type=_positive_int, default=_DEFAULT_CHUNK_SIZE, metavar='N',
+        help='send --batch words to processes N at a time (default: %(default)s)')
+    parser.add_argument('--build-index', metavar='PATH',
+        help='write an index of every conjugation of the verbs on stdin to PATH')
+    parser.add_argument('--serve', metavar='ADDRESS',
+        help='serve line-delimited JSON requests on tcp:HOST:PORT or unix:PATH')
+    parser.add_argument('--connect', metavar='ADDRESS',
+        help='run --batch on the server at ADDRESS, starting one on unix:PATH if needed')
+    parser.add_argument('--stats', metavar='PATH',
+        help='record call statistics and write them to PATH on exit')
+    parser.add_argument('--stats-format', choices=['json', 'prometheus'], default='json',
+        help='format for --stats (default: json)')
+    options = parser.parse_args(args)
+    
+    if options.stats is not None:
+        enable_instrumentation()
+        try:
+            return _main_noninteractive(options)
+        finally:
+            dump_instrumentation(options.stats, options.stats_format)
+    else:
+        return _main_noninteractive(options)
+
+def _main_noninteractive(options):
+    if options.batch is not None:
+        return _main_batch(options)
+    if options.scan:
+        return _main_scan(options)
+    if options.build_index is not None:
+        in_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        build_index(read_lexicon(in_stream), options.build_index)
+        return 0
+    if options.serve is not None:
+        import asyncio
+        
+        try:
+            asyncio.run(serve(options.serve))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    return _main_interactive()
+
+def _main_interactive():
     print('Commands:')
     print('  unte <te_form> - Convert て-form verb or adjective -> dict-form.')
     print('  te <dict_verb> - Convert dict-form verb -> て-form.')
+    print('  deinflect <verb> - Convert conjugated verb -> dict-form + form.')
+    print('  deinflect_adjective <adjective> - Convert conjugated adjective -> dict-form + form.')
     print()
     print('Metacommands:')
     print('  repeat <command> - Run <command> multiple times.')
@@ -391,11 +2476,20 @@ def main():
         pass
 
 def _run_command(func, args):
+    import traceback
+    
+    if func.__name__ in _BATCH_COMMANDS and args:
+        args = [normalize(args[0])] + args[1:]
     try:
         if hasattr(func, 'expects_verb_entry'):
-            if args[0].endswith('る'):
-                result1 = func({ 'dict_verb': args[0], 'is_ru_verb': True })
-                result2 = func({ 'dict_verb': args[0], 'is_ru_verb': False })
+            verb_entries = _verb_entries_for(args[0])
+            for verb_entry in verb_entries:
+                if not can_conjugate(verb_entry, func.__name__):
+                    print('*** ' + _VALIDATING_FORM_FOR_NAME[func.__name__].error_message + args[0])
+                    return
+            if len(verb_entries) == 2:
+                result1 = func(verb_entries[0])
+                result2 = func(verb_entries[1])
                 if result1 != result2:
                     result = [
                         '(if る-verb) ' + result1,
@@ -404,7 +2498,7 @@ def _run_command(func, args):
                 else:
                     result = [result1]
             else:
-                result = [func({ 'dict_verb': args[0], 'is_ru_verb': False })]
+                result = [func(verb_entries[0])]
         else:
             result = func(*args)
     except Exception as e:
@@ -413,6 +2507,273 @@ def _run_command(func, args):
         if result is not None:
             print(result)
 
+# Returns the possible verb entries for a dict-form verb typed by the user.
+# 
+# The verb class is resolved with guess_is_ru_verb() where possible.
+# Otherwise the verb may be either a る-verb or an う-verb, and both are
+# returned. verb_class_stats() counts how often each case happens.
+def _verb_entries_for(dict_verb):
+    is_ru_verb = guess_is_ru_verb(dict_verb)
+    if is_ru_verb is None:
+        _verb_class_counts['fallback'] += 1
+        return [VerbEntry(dict_verb, True), VerbEntry(dict_verb, False)]
+    else:
+        _verb_class_counts['resolved'] += 1
+        return [VerbEntry(dict_verb, is_ru_verb)]
+
+_verb_class_counts = collections.Counter(resolved=0, fallback=0)
+
+# Returns how many verbs typed by the user had their verb class resolved
+# from the spelling alone and how many fell back to trying both classes,
+# as a dict of the form {'resolved': n, 'fallback': n}.
+# 
+# Verbs conjugated in worker processes by run_batch() are not counted.
+def verb_class_stats():
+    return dict(_verb_class_counts)
+
+def _main_batch(options):
+    if options.batch not in _BATCH_COMMANDS:
+        print('*** Unknown command: ' + options.batch, file=sys.stderr)
+        return 2
+    
+    in_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    out_stream = open(sys.stdout.fileno(), 'w',
+        encoding='utf-8', newline='\n', buffering=_BATCH_BUFFER_SIZE, closefd=False)
+    if options.errors is not None:
+        err_stream = open(options.errors, 'w', encoding='utf-8')
+    else:
+        err_stream = sys.stderr
+    try:
+        if options.connect is not None:
+            run_remote_batch(options.connect, options.batch, in_stream, out_stream,
+                err_stream, options.format, chunk_size=options.chunk_size)
+        else:
+            run_batch(options.batch, in_stream, out_stream, err_stream, options.format,
+                workers=options.workers or None, chunk_size=options.chunk_size)
+    finally:
+        out_stream.flush()
+        if err_stream is not sys.stderr:
+            err_stream.close()
+    return 0
+
+_BATCH_BUFFER_SIZE = 1 << 16
+
+# Writes one line per verb found by scan() in the document on stdin,
+# as <offset> TAB <surface> TAB <JSON list of candidates> for tsv.
+def _main_scan(options):
+    import json
+    
+    in_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    out_stream = open(sys.stdout.fileno(), 'w',
+        encoding='utf-8', newline='\n', buffering=_BATCH_BUFFER_SIZE, closefd=False)
+    try:
+        for (offset, surface, candidates) in scan(in_stream):
+            if options.format == 'jsonl':
+                out_stream.write(json.dumps(
+                    { 'offset': offset, 'surface': surface, 'candidates': candidates },
+                    ensure_ascii=False) + '\n')
+            else:
+                out_stream.write(
+                    str(offset) + '\t' + surface + '\t' +
+                    json.dumps(candidates, ensure_ascii=False) + '\n')
+    finally:
+        out_stream.flush()
+    return 0
+
+# Commands that run_batch() accepts.
+_BATCH_COMMANDS = frozenset(
+    [name for (name, value) in globals().items() if hasattr(value, 'expects_verb_entry')] +
+    ['unte', 'deinflect', 'deinflect_adjective'])
+
+# Runs the named command on each line of in_stream, one word per line,
+# writing one output line per result.
+# 
+# Formats:
+# * 'tsv' - <input> TAB <result> TAB <る-verb, う-verb, or empty>
+# * 'jsonl' - {"input": ..., "output": ..., "is_ru_verb": true, false, or null}
+# 
+# Each word is passed through normalize() first, so katakana and romaji
+# are read as hiragana, but <input> is the word as given.
+# 
+# Lines that fail are reported to err_stream as <input> TAB <error>
+# rather than stopping the batch. Returns the number of failed lines.
+# 
+# See _map_chunks() for workers and chunk_size.
+# Memory use is independent of the length of in_stream.
+def run_batch(command, in_stream, out_stream, err_stream, output_format='tsv',
+        workers=1, chunk_size=None):
+    if command not in _BATCH_COMMANDS:
+        raise ValueError('Expected batch command: ' + command)
+    if output_format not in _BATCH_OUTPUT_FORMATS:
+        raise ValueError('Expected batch output format: ' + output_format)
+    
+    words = (word for word in (line.strip() for line in in_stream) if word)
+    error_count = 0
+    for (out_text, err_text, chunk_error_count) in _map_chunks(
+            _format_batch_chunk, (command, output_format), words, workers, chunk_size):
+        out_stream.write(out_text)
+        if err_text:
+            err_stream.write(err_text)
+        error_count += chunk_error_count
+    return error_count
+
+_DEFAULT_CHUNK_SIZE = 1000
+
+# Runs the named command on each word, yielding (word, results, error) in
+# the same order as the words, where results is a list of (is_ru_verb, result)
+# and error describes why the word failed, or is None.
+# 
+# See _map_chunks() for workers and chunk_size.
+def iter_batch_results(command, words, workers=1, chunk_size=None):
+    if command not in _BATCH_COMMANDS:
+        raise ValueError('Expected batch command: ' + command)
+    for records in _map_chunks(_run_batch_chunk, (command,), words, workers, chunk_size):
+        yield from records
+
+# Splits items into chunks of chunk_size and yields func(*args, chunk)
+# for each chunk, in order. Raises ValueError if chunk_size is less than 1.
+# 
+# Chunks are sent to a pool of worker processes. If workers is None then
+# one process is used per CPU. If workers is 1 then the chunks are processed
+# in this process instead.
+# 
+# Only a few chunks per worker are in flight at once, so memory use is
+# independent of the number of items.
+def _map_chunks(func, args, items, workers=1, chunk_size=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = _DEFAULT_CHUNK_SIZE
+    if chunk_size < 1:
+        raise ValueError('Expected chunk size of at least 1: %d' % chunk_size)
+    
+    items = iter(items)
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+    if workers == 1:
+        for chunk in chunks:
+            yield func(*args, chunk)
+        return
+    
+    import multiprocessing
+    
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(func, args + (chunk,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def _run_batch_chunk(command, words):
+    func = globals()[command]
+    invalid_error = _BATCH_INVALID_ERRORS.get(command)
+    records = []
+    for word in words:
+        try:
+            results = _batch_results(func, normalize(word))
+        except Exception as e:
+            records.append((word, None, type(e).__name__ + ': ' + str(e)))
+            continue
+        if results is None:
+            records.append((word, None, invalid_error + word))
+        else:
+            records.append((word, results, None))
+    return records
+
+# Batch command -> the error for a word that it rejects before running,
+# as the ValueError it would otherwise raise would be reported,
+# less the word itself.
+_BATCH_INVALID_ERRORS = {
+    form_name: 'ValueError: ' + validating_form.error_message
+    for (form_name, validating_form) in _VALIDATING_FORM_FOR_NAME.items()
+    if validating_form is not None
+}
+_BATCH_INVALID_ERRORS['unte'] = 'ValueError: Expected て-form to end with て or で: '
+
+# Runs the named command on each word, returning (out_text, err_text, error_count)
+# as run_batch() would write them.
+# 
+# Formatting is done here rather than by run_batch() so that worker processes
+# do it in parallel, and only one string per chunk crosses between processes.
+def _format_batch_chunk(command, output_format, words):
+    write_row = _batch_row_writer(output_format)
+    out_stream = io.StringIO()
+    err_stream = io.StringIO()
+    error_count = 0
+    for (word, results, error) in _run_batch_chunk(command, words):
+        if error is not None:
+            err_stream.write(word + '\t' + error + '\n')
+            error_count += 1
+            continue
+        for (is_ru_verb, result) in results:
+            write_row(out_stream, word, result, is_ru_verb)
+    return (out_stream.getvalue(), err_stream.getvalue(), error_count)
+
+# Returns (is_ru_verb, result) for each result of running func on word,
+# where is_ru_verb is None if the result does not depend on the verb class.
+# 
+# Returns None instead if func cannot take the word, which is checked
+# before running func, so that batches full of invalid words do not pay
+# for raising and catching a ValueError on each one.
+def _batch_results(func, word):
+    if hasattr(func, 'expects_verb_entry'):
+        validating_form = _VALIDATING_FORM_FOR_NAME[func.__name__]
+        if validating_form is not None and word[-1:] not in validating_form.last_characters:
+            # Rejected without building a verb entry
+            return None
+        verb_entries = _verb_entries_for(word)
+        if validating_form is not None:
+            conjugation_classes = validating_form.conjugation_classes
+            for verb_entry in verb_entries:
+                if verb_entry.conjugation_class not in conjugation_classes:
+                    return None
+        if verb_entries[0].irregular_ending is not None:
+            return [(None, func(verb_entries[0]))]
+        results = [func(verb_entry) for verb_entry in verb_entries]
+        if len(results) == 2 and results[0] == results[1]:
+            return [(None, results[0])]
+        return [
+            (verb_entry.is_ru_verb, result)
+            for (verb_entry, result) in zip(verb_entries, results)
+        ]
+    elif func is unte:
+        dict_forms = try_unte(word)
+        if dict_forms is None:
+            return None
+        return [(None, dict_form) for dict_form in dict_forms]
+    else:
+        return [(None, result) for result in func(word)]
+
+# Returns a function that writes one batch result row in the specified format,
+# given (out_stream, word, result, is_ru_verb). See run_batch() for formats.
+# 
+# json is imported here, once per batch or chunk, rather than for every row.
+def _batch_row_writer(output_format):
+    import json
+    
+    json_dumps = json.dumps
+    if output_format == 'tsv':
+        def write_tsv_row(out_stream, word, result, is_ru_verb):
+            if not isinstance(result, str):
+                result = json_dumps(result, ensure_ascii=False)
+            if is_ru_verb is None:
+                verb_class = ''
+            else:
+                verb_class = 'る-verb' if is_ru_verb else 'う-verb'
+            out_stream.write(word + '\t' + result + '\t' + verb_class + '\n')
+        return write_tsv_row
+    elif output_format == 'jsonl':
+        def write_jsonl_row(out_stream, word, result, is_ru_verb):
+            out_stream.write(json_dumps(
+                { 'input': word, 'output': result, 'is_ru_verb': is_ru_verb },
+                ensure_ascii=False))
+            out_stream.write('\n')
+        return write_jsonl_row
+    else:
+        raise ValueError('Expected batch output format: ' + output_format)
+
+_BATCH_OUTPUT_FORMATS = frozenset(['tsv', 'jsonl'])
 
 def repeat(cmd):
     if cmd not in globals():
@@ -432,4 +2793,4 @@ def quit():
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
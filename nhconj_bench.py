@@ -0,0 +1,805 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for nhconj.
+#
+# Usage:
+#   ./nhconj_bench.py             - Run all benchmarks.
+#   ./nhconj_bench.py <name> ...  - Run the named benchmarks.
+#
+# Options:
+#   --save <path>       - Save results as a JSON baseline.
+#   --compare <path>    - Fail if any result is slower or allocates more than
+#                         a saved baseline by more than --threshold, or if a
+#                         benchmark run no longer reports a saved result.
+#   --threshold <frac>  - Allowed regression, as a fraction. (default: 0.25)
+#
+
+import argparse
+import asyncio
+import io
+import json
+import nhconj
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+
+_BENCHMARKS = {}
+
+# Decorator to register a benchmark under its function name.
+def benchmark(func):
+    _BENCHMARKS[func.__name__] = func
+    return func
+
+# Results reported by the benchmarks run so far, keyed by
+# '<benchmark>/<label>', for saving and comparing against a baseline.
+_NS_PER_CALL = {}
+_PEAK_BYTES_PER_CALL = {}
+_current_benchmark = None
+
+
+# Times calls of func(arg) over every arg in args, returning the best
+# nanoseconds per call over several repeats.
+def _ns_per_call(func, args, repeat=5):
+    def run():
+        for arg in args:
+            func(arg)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(args) * 1e9
+
+# Traces calls of func(arg) over every arg in args, returning the average
+# peak of memory allocated during a single call, in bytes.
+def _peak_bytes_per_call(func, args):
+    total = 0
+    tracemalloc.start()
+    try:
+        for arg in args:
+            tracemalloc.reset_peak()
+            (before, _) = tracemalloc.get_traced_memory()
+            func(arg)
+            (_, peak) = tracemalloc.get_traced_memory()
+            total += peak - before
+    finally:
+        tracemalloc.stop()
+    return total / len(args)
+
+def _report(label, ns_per_call, baseline_ns_per_call=None, peak_bytes_per_call=None):
+    key = _current_benchmark + '/' + label
+    _NS_PER_CALL[key] = ns_per_call
+    line = '  %-28s %8.1f ns/call' % (label, ns_per_call)
+    if peak_bytes_per_call is not None:
+        _PEAK_BYTES_PER_CALL[key] = peak_bytes_per_call
+        line += '  %8.0f B/call peak' % peak_bytes_per_call
+    if baseline_ns_per_call is not None:
+        line += '  (%.2fx)' % (baseline_ns_per_call / ns_per_call)
+    print(line)
+
+
+# ------------------------------------------------------------------------------
+# unte
+
+# The original hand-ordered if-chain implementation of nhconj.unte(),
+# kept only as a baseline for comparison.
+def _unte_if_chain(te_form):
+    if te_form == 'よくて':
+        return ['いい']
+    if te_form.endswith('くて'):
+        prefix = te_form[:-2]
+        return [prefix + 'い']
+    if te_form.endswith('くなって'):
+        prefix = te_form[:-4]
+        return [prefix + 'い + negative']
+    if te_form == 'いって':
+        return ['いく']
+    if te_form.endswith('って'):
+        prefix = te_form[:-2]
+        return [prefix + 'う', prefix + 'つ', prefix + 'る']
+    if te_form.endswith('んで'):
+        prefix = te_form[:-2]
+        return [prefix + 'む', prefix + 'ぶ', prefix + 'ぬ']
+    if te_form.endswith('いて'):
+        prefix = te_form[:-2]
+        return [prefix + 'く']
+    if te_form.endswith('いで'):
+        prefix = te_form[:-2]
+        return [prefix + 'ぐ']
+    if te_form.endswith('して'):
+        prefix = te_form[:-2]
+        return [prefix + 'す']
+    if te_form.endswith('て'):
+        prefix = te_form[:-1]
+        return [prefix + 'る']
+    if te_form.endswith('で'):
+        prefix = te_form[:-1]
+        return [prefix]
+    raise ValueError(
+        'Expected て-form to end with て or で: ' + te_form)
+
+_UNTE_INPUTS = [
+    'はなして', 'わかって', 'たべて', 'よんで', 'かいて', 'およいで',
+    'いって', 'あつくて', 'あつくなって', 'よくて', 'げんきで', 'みて',
+    'おきて', 'まって', 'あそんで', 'しんで', 'ききて', 'べんきょうして',
+]
+
+_UNTE_FREQUENCY_TABLE_SIZE = 100000
+
+@benchmark
+def unte():
+    args = _UNTE_INPUTS * 1000
+    for te_form in _UNTE_INPUTS:
+        assert nhconj.unte(te_form) == _unte_if_chain(te_form), te_form
+    
+    print('unte (%d inputs):' % len(args))
+    baseline = _ns_per_call(_unte_if_chain, args)
+    _report('if-chain', baseline)
+    _report('suffix trie', _ns_per_call(nhconj.unte, args), baseline)
+    
+    # Common verbs, weighted by rank, among many rare synthetic ones
+    frequency_table = nhconj.FrequencyTable(
+        [(dict_verb, len(_CORPUS_VERBS) - rank)
+            for (rank, (dict_verb, _)) in enumerate(_CORPUS_VERBS)] +
+        [(verb_entry.dict_verb, 1) for verb_entry in _synthetic_lexicon(_UNTE_FREQUENCY_TABLE_SIZE)])
+    _report('rank_unte', _ns_per_call(
+        lambda te_form: nhconj.rank_unte(te_form, frequency_table), args), baseline)
+
+
+# ------------------------------------------------------------------------------
+# deinflect
+
+_DEINFLECT_INPUTS = [
+    'はなして', 'わかって', 'たべられた', 'よまれなかった', 'いきたい',
+    'みませんでした', 'しよう', 'こられる', 'かいたり', 'およがない',
+]
+
+@benchmark
+def deinflect():
+    args = _DEINFLECT_INPUTS * 200
+    print('deinflect (%d inputs, %d forms):' % (
+        len(args), len(nhconj._DEINFLECTABLE_FORMS)))
+    _report('deinflect', _ns_per_call(nhconj.deinflect, args))
+
+
+# ------------------------------------------------------------------------------
+# conjugate_many
+
+_MANY_VERBS = [
+    ('たべる', True), ('みる', True), ('とる', False), ('かえる', False),
+    ('かう', False), ('まつ', False), ('よむ', False), ('あそぶ', False),
+    ('しぬ', False), ('かく', False), ('およぐ', False), ('はなす', False),
+    ('べんきょうする', False), ('くる', False), ('いく', False), ('ある', False),
+]
+_MANY_COUNT = 1000000
+
+@benchmark
+def conjugate_many():
+    pairs = (_MANY_VERBS * (_MANY_COUNT // len(_MANY_VERBS) + 1))[:_MANY_COUNT]
+    verbs = [dict_verb for (dict_verb, _) in pairs]
+    is_ru_flags = [is_ru_verb for (_, is_ru_verb) in pairs]
+    
+    print('conjugate_many (%d verbs):' % len(verbs))
+    for form_name in ['te', 'potential', 'long_past_neg']:
+        form = getattr(nhconj, form_name)
+        def loop():
+            return [
+                form({ 'dict_verb': dict_verb, 'is_ru_verb': is_ru_verb })
+                for (dict_verb, is_ru_verb) in zip(verbs, is_ru_flags)
+            ]
+        def many():
+            return nhconj.conjugate_many(form_name, verbs, is_ru_flags)
+        assert loop() == many()
+        
+        baseline = _ns_per_call(lambda _: loop(), [None], repeat=1) / len(verbs)
+        _report(form_name + ' loop', baseline)
+        _report(form_name + ' conjugate_many',
+            _ns_per_call(lambda _: many(), [None], repeat=1) / len(verbs), baseline)
+
+
+# ------------------------------------------------------------------------------
+# VerbEntry
+
+@benchmark
+def verb_entry():
+    pairs = _MANY_VERBS * 500
+    dicts = [
+        { 'dict_verb': dict_verb, 'is_ru_verb': is_ru_verb }
+        for (dict_verb, is_ru_verb) in pairs
+    ]
+    entries = [nhconj.VerbEntry(dict_verb, is_ru_verb) for (dict_verb, is_ru_verb) in pairs]
+    
+    print('VerbEntry (%d verbs):' % len(pairs))
+    print('  %-28s %8d bytes' % ('dict size', sys.getsizeof(dicts[0])))
+    print('  %-28s %8d bytes' % ('VerbEntry size', sys.getsizeof(entries[0])))
+    for form_name in ['long_past_neg', 'short_present_neg']:
+        form = getattr(nhconj, form_name)
+        baseline = _ns_per_call(form, dicts)
+        _report(form_name + ' dict', baseline)
+        _report(form_name + ' VerbEntry', _ns_per_call(form, entries), baseline)
+
+
+# ------------------------------------------------------------------------------
+# _replace_vowel_suffix
+
+# The original romaji()/unromaji() round-trip implementation of
+# nhconj._replace_vowel_suffix(), kept only as a baseline for comparison.
+def _replace_vowel_suffix_round_trip(dict_verb, old_vowel, new_vowel):
+    last = nhconj.romaji(dict_verb[-1])
+    if last[-1] != old_vowel:
+        raise ValueError(
+            'Expected verb to end with vowel "' + old_vowel + '": ' + dict_verb)
+    last = last[:-1] + new_vowel
+    if old_vowel == 'u' and last in ['a', 'o', 'u']:    # exception: [u] -> [w*]
+        last = 'w' + last
+    last = nhconj.unromaji(last)
+    return dict_verb[:-1] + last
+
+@benchmark
+def replace_vowel_suffix():
+    args = ['かう', 'まつ', 'よむ', 'あそぶ', 'しぬ', 'かく', 'およぐ', 'はなす'] * 1000
+    
+    print('_replace_vowel_suffix (%d verbs):' % len(args))
+    for (old_vowel, new_vowel) in [('u', 'i'), ('u', 'a')]:
+        for dict_verb in args[:8]:
+            assert (
+                nhconj._replace_vowel_suffix(dict_verb, old_vowel, new_vowel) ==
+                _replace_vowel_suffix_round_trip(dict_verb, old_vowel, new_vowel))
+        
+        baseline = _ns_per_call(
+            lambda v: _replace_vowel_suffix_round_trip(v, old_vowel, new_vowel), args)
+        _report('%s->%s romaji round trip' % (old_vowel, new_vowel), baseline)
+        _report('%s->%s table' % (old_vowel, new_vowel), _ns_per_call(
+            lambda v: nhconj._replace_vowel_suffix(v, old_vowel, new_vowel), args),
+            baseline)
+
+
+# ------------------------------------------------------------------------------
+# conjugate_all
+
+# Returns count verb entries drawn from verbs with a Zipfian
+# distribution, as in running text. Earlier verbs are more frequent.
+def _zipfian_entries(count, seed=0, verbs=_MANY_VERBS):
+    entries = [
+        nhconj.VerbEntry(dict_verb, is_ru_verb)
+        for (dict_verb, is_ru_verb) in verbs
+    ]
+    weights = [1 / rank for rank in range(1, len(entries) + 1)]
+    return random.Random(seed).choices(entries, weights, k=count)
+
+@benchmark
+def conjugate_all():
+    args = _zipfian_entries(5000)
+    form_names = list(nhconj.conjugate_all(args[0]))
+    def each_form(verb_entry):
+        return {
+            form_name: getattr(nhconj, form_name)(verb_entry)
+            for form_name in form_names
+        }
+    
+    print('conjugate_all (%d verbs, %d forms):' % (len(args), len(form_names)))
+    baseline = _ns_per_call(each_form, args)
+    _report('each form', baseline)
+    _report('conjugate_all', _ns_per_call(nhconj.conjugate_all, args), baseline)
+    nhconj.enable_conjugate_all_cache(maxsize=1024)
+    try:
+        _report('conjugate_all + LRU cache',
+            _ns_per_call(nhconj.conjugate_all, args), baseline)
+        info = nhconj.conjugate_all_cache_info()
+        print('  %d hits, %d misses' % (info.hits, info.misses))
+    finally:
+        nhconj.disable_conjugate_all_cache()
+
+
+# ------------------------------------------------------------------------------
+# paradigm
+
+# Conjugates every chain in a paradigm by calling each form in turn,
+# kept only as a baseline for comparison.
+def _paradigm_each_chain(verb_entry, chains):
+    forms = {}
+    for chain in chains:
+        entry = verb_entry
+        form_names = chain.split('+')
+        for form_name in form_names[:-1]:
+            entry = nhconj.VerbEntry(getattr(nhconj, form_name)(entry), True)
+        forms[chain] = getattr(nhconj, form_names[-1])(entry)
+    return forms
+
+@benchmark
+def paradigm():
+    args = _zipfian_entries(2000)
+    chains = list(nhconj.paradigm(args[0]))
+    assert _paradigm_each_chain(args[0], chains) == nhconj.paradigm(args[0])
+    
+    print('paradigm (%d verbs, %d forms):' % (len(args), len(chains)))
+    baseline = _ns_per_call(lambda e: _paradigm_each_chain(e, chains), args, repeat=3)
+    _report('each chain', baseline)
+    _report('paradigm', _ns_per_call(nhconj.paradigm, args, repeat=3), baseline)
+
+
+# ------------------------------------------------------------------------------
+# run_batch
+
+_PARALLEL_COUNT = 200000
+_PARALLEL_WORKERS = [1, 2, 4, 8, 16]
+
+@benchmark
+def parallel():
+    words = [dict_verb for (dict_verb, _) in _MANY_VERBS]
+    words = (words * (_PARALLEL_COUNT // len(words) + 1))[:_PARALLEL_COUNT]
+    te_forms = [nhconj.te(nhconj.VerbEntry(word, False)) for word in words]
+    
+    print('run_batch (%d words):' % len(words))
+    for (command, args) in [('te', words), ('unte', te_forms)]:
+        text = '\n'.join(args) + '\n'
+        for workers in _PARALLEL_WORKERS:
+            start = time.perf_counter()
+            nhconj.run_batch(command, io.StringIO(text), io.StringIO(), io.StringIO(),
+                workers=workers, chunk_size=5000)
+            elapsed = time.perf_counter() - start
+            print('  %-28s %8.0f words/s' % (
+                '%s, %d workers' % (command, workers), len(args) / elapsed))
+
+
+# ------------------------------------------------------------------------------
+# Invalid input
+
+_INVALID_WORDS = ['hello', '123', '。', 'たべた', 'ぱ', 'ｘｙｚ', '東京', 'ネコ', '、', 'ね']
+_INVALID_BATCH_COUNT = 100000
+_INVALID_FRACTIONS = [0.0, 0.1, 0.5]
+
+# The way to conjugate a word that may be invalid before try_conjugate(),
+# kept only as a baseline for comparison.
+def _te_or_none(verb_entry):
+    try:
+        return nhconj.te(verb_entry)
+    except ValueError:
+        return None
+
+@benchmark
+def invalid():
+    verb_entries = [nhconj.VerbEntry(word, False) for word in _INVALID_WORDS]
+    print('invalid verbs (%d words):' % len(verb_entries))
+    baseline_ns = _ns_per_call(_te_or_none, verb_entries)
+    _report('te, catching ValueError', baseline_ns)
+    _report('try_conjugate', _ns_per_call(
+        lambda verb_entry: nhconj.try_conjugate(verb_entry, 'te'), verb_entries), baseline_ns)
+    
+    rng = random.Random(0)
+    valid_words = [dict_verb for (dict_verb, _) in _MANY_VERBS]
+    print('run_batch te (%d words):' % _INVALID_BATCH_COUNT)
+    for fraction in _INVALID_FRACTIONS:
+        words = [
+            rng.choice(_INVALID_WORDS) if rng.random() < fraction else rng.choice(valid_words)
+            for _ in range(_INVALID_BATCH_COUNT)
+        ]
+        text = '\n'.join(words) + '\n'
+        start = time.perf_counter()
+        nhconj.run_batch('te', io.StringIO(text), io.StringIO(), io.StringIO())
+        elapsed = time.perf_counter() - start
+        _report('%d%% invalid' % (fraction * 100), elapsed / len(words) * 1e9)
+
+
+# ------------------------------------------------------------------------------
+# normalize
+
+_NORMALIZE_STREAM_COUNT = 200000
+
+# Returns the romaji of a hiragana word, as romaji() spells each kana.
+def _romaji_word(word):
+    return ''.join(nhconj.romaji(kana) for kana in word)
+
+@benchmark
+def normalize():
+    verb_entries = [nhconj.VerbEntry(dict_verb, is_ru_verb) for (dict_verb, is_ru_verb) in _MANY_VERBS]
+    hiragana = [verb_entry.dict_verb for verb_entry in verb_entries]
+    katakana = [word.translate({ord(c): ord(c) + nhconj._KATAKANA_OFFSET for c in word}) for word in hiragana]
+    romaji = [_romaji_word(word) for word in hiragana if 'ゃ' not in word and 'ゅ' not in word and 'ょ' not in word]
+    assert [nhconj.normalize(word) for word in katakana] == hiragana
+    
+    print('normalize (%d words):' % len(hiragana))
+    te_ns = _ns_per_call(nhconj.te, verb_entries)
+    _report('te (for comparison)', te_ns)
+    _report('hiragana', _ns_per_call(nhconj.normalize, hiragana), te_ns)
+    _report('katakana', _ns_per_call(nhconj.normalize, katakana), te_ns)
+    _report('romaji', _ns_per_call(nhconj.normalize, romaji), te_ns)
+    _report('romaji, not cached', _ns_per_call(nhconj._unromaji_word, romaji), te_ns)
+    
+    lines = [word + '\n' for word in romaji]
+    lines = (lines * (_NORMALIZE_STREAM_COUNT // len(lines) + 1))[:_NORMALIZE_STREAM_COUNT]
+    start = time.perf_counter()
+    for _ in nhconj.normalize_lines(io.StringIO(''.join(lines))):
+        pass
+    elapsed = time.perf_counter() - start
+    print('  %-28s %8.0f words/s' % ('normalize_lines, romaji', len(lines) / elapsed))
+
+
+# ------------------------------------------------------------------------------
+# ConjugationIndex
+
+_INDEX_LEMMAS = 50000
+
+_STEM_KANA = [kana for (_, kanas) in nhconj._HIRAGANA_ROWS for kana in kanas if kana != '　']
+_DICT_ENDINGS = ['う', 'く', 'ぐ', 'す', 'つ', 'ぬ', 'ぶ', 'む', 'る']
+
+# Returns count distinct synthetic verb entries built from random kana stems.
+def _synthetic_lexicon(count, seed=0):
+    rng = random.Random(seed)
+    entries = set()
+    while len(entries) < count:
+        dict_verb = ''.join(rng.choices(_STEM_KANA, k=rng.randint(1, 4))) + rng.choice(_DICT_ENDINGS)
+        entries.add(nhconj.VerbEntry(dict_verb, dict_verb.endswith('る') and rng.random() < 0.5))
+    return sorted(entries, key=lambda e: (e.dict_verb, e.is_ru_verb))
+
+def _rss_kib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+@benchmark
+def index():
+    entries = _synthetic_lexicon(_INDEX_LEMMAS)
+    print('ConjugationIndex (%d lemmas):' % len(entries))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'index')
+        start = time.perf_counter()
+        nhconj.build_index(entries, path)
+        print('  %-28s %8.1f s' % ('build', time.perf_counter() - start))
+        print('  %-28s %8d KiB' % ('file size', os.path.getsize(path) // 1024))
+        
+        rss_before = _rss_kib()
+        start = time.perf_counter()
+        index = nhconj.ConjugationIndex(path)
+        print('  %-28s %8.1f us' % ('open', (time.perf_counter() - start) * 1e6))
+        try:
+            te_forms = [nhconj.te(entry) for entry in entries[:2000]]
+            dict_verbs = [entry.dict_verb for entry in entries[:2000]]
+            _report('lookup (unte-style)', _ns_per_call(index.lookup, te_forms))
+            _report('conjugate (te-style)',
+                _ns_per_call(lambda v: index.conjugate(v, 'te'), dict_verbs))
+            print('  %-28s %8d KiB' % ('RSS growth after lookups', _rss_kib() - rss_before))
+        finally:
+            index.close()
+
+
+# ------------------------------------------------------------------------------
+# ConjugationTable
+
+_TABLE_LEMMAS = 20000
+
+# Times correcting the class of one verb in a table, against regenerating
+# every form of the whole lexicon for each correction.
+@benchmark
+def table():
+    entries = _synthetic_lexicon(_TABLE_LEMMAS)
+    print('ConjugationTable (%d lemmas):' % len(entries))
+    start = time.perf_counter()
+    conjugation_table = nhconj.ConjugationTable(entries)
+    build_ns = (time.perf_counter() - start) * 1e9
+    _report('build', build_ns)
+    
+    # Flip each る-ending verb to the other class, and back again
+    corrections = [
+        (entry, nhconj.VerbEntry(entry.dict_verb, not entry.is_ru_verb))
+        for entry in entries
+        if entry.dict_verb.endswith('る') and
+            nhconj.VerbEntry(entry.dict_verb, not entry.is_ru_verb) not in conjugation_table
+    ][:1000]
+    def correct(correction):
+        (old_entry, new_entry) = correction
+        conjugation_table.update(old_entry, new_entry)
+        conjugation_table.update(new_entry, old_entry)
+    _report('update (class correction)', _ns_per_call(correct, corrections) / 2, build_ns)
+
+
+# ------------------------------------------------------------------------------
+# scan
+
+_SCAN_SIZES_MB = [1, 4]
+_SCAN_KANJI = '食読書見行来話聞言思帰入出写撮作使待買売'
+_SCAN_SENTENCE_FORMS = ['te', 'short_past_aff', 'long_past_aff', 'short_past_neg', 'tai', 'passive']
+
+# Returns a synthetic document of about size_mb million characters,
+# made of kanji-stem verbs in assorted forms between particles and punctuation.
+def _synthetic_document(size_mb, seed=0):
+    rng = random.Random(seed)
+    pieces = []
+    length = 0
+    while length < size_mb * 1000000:
+        dict_verb = rng.choice(_SCAN_KANJI) + rng.choice(_DICT_ENDINGS)
+        verb_entry = nhconj.VerbEntry(dict_verb, dict_verb.endswith('る') and rng.random() < 0.5)
+        form = getattr(nhconj, rng.choice(_SCAN_SENTENCE_FORMS))
+        piece = rng.choice(_SCAN_KANJI) + rng.choice('をにはがで') + form(verb_entry) + rng.choice('。、')
+        pieces.append(piece)
+        length += len(piece)
+    return ''.join(pieces)
+
+@benchmark
+def scan():
+    print('scan:')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size_mb in _SCAN_SIZES_MB:
+            path = os.path.join(temp_dir, 'document')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(_synthetic_document(size_mb))
+            
+            rss_before = _rss_kib()
+            start = time.perf_counter()
+            with open(path, encoding='utf-8') as f:
+                found = sum(1 for _ in nhconj.scan(f))
+            elapsed = time.perf_counter() - start
+            print('  %-28s %8.2f s, %8d verbs, %8.0f ns/char, RSS growth %d KiB' % (
+                '%d M chars' % size_mb, elapsed, found,
+                elapsed * 1e9 / (size_mb * 1000000), _rss_kib() - rss_before))
+
+
+# ------------------------------------------------------------------------------
+# ConjugationServer
+
+_SERVER_CLIENTS = [1, 10, 100]
+_SERVER_REQUESTS_PER_CLIENT = 500
+
+# Runs clients concurrent connections against a server at a unix socket path.
+# Each client sends requests one at a time, waiting for each response.
+# Returns (latencies in seconds, elapsed seconds).
+async def _load(path, clients, requests_per_client):
+    words = [dict_verb for (dict_verb, _) in _MANY_VERBS]
+    latencies = []
+    
+    async def client(client_number):
+        (reader, writer) = await asyncio.open_unix_connection(path)
+        for i in range(requests_per_client):
+            request = { 'id': i, 'command': 'te', 'word': words[(client_number + i) % len(words)] }
+            start = time.perf_counter()
+            writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            assert response['id'] == i and 'results' in response, response
+        writer.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[client(n) for n in range(clients)])
+    return (latencies, time.perf_counter() - start)
+
+def _wait_for_unix_socket(path):
+    while True:
+        sock = socket.socket(socket.AF_UNIX)
+        try:
+            sock.connect(path)
+            return
+        except OSError:
+            time.sleep(0.01)
+        finally:
+            sock.close()
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+@benchmark
+def server():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'socket')
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nhconj.py'),
+                '--serve', 'unix:' + path])
+        try:
+            _wait_for_unix_socket(path)
+            
+            print('ConjugationServer (%d requests per client):' % _SERVER_REQUESTS_PER_CLIENT)
+            for clients in _SERVER_CLIENTS:
+                (latencies, elapsed) = asyncio.run(_load(path, clients, _SERVER_REQUESTS_PER_CLIENT))
+                latencies.sort()
+                print('  %-28s p50 %7.0f us, p99 %7.0f us, %8.0f requests/s' % (
+                    '%d clients' % clients,
+                    _percentile(latencies, 0.50) * 1e6,
+                    _percentile(latencies, 0.99) * 1e6,
+                    len(latencies) / elapsed))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+# ------------------------------------------------------------------------------
+# functions
+
+# Common verbs, roughly from most to least frequent in running text.
+_CORPUS_VERBS = [
+    ('する', False), ('いる', True), ('ある', False), ('なる', False), ('いう', False),
+    ('いく', False), ('くる', False), ('みる', True), ('おもう', False), ('できる', True),
+    ('しる', False), ('もつ', False), ('つかう', False), ('かんがえる', True), ('でる', True),
+    ('かく', False), ('よむ', False), ('きく', False), ('たべる', True), ('のむ', False),
+    ('はなす', False), ('まつ', False), ('かえる', False), ('はいる', False), ('つくる', False),
+    ('あう', False), ('かう', False), ('ねる', True), ('おきる', True), ('あそぶ', False),
+    ('およぐ', False), ('しぬ', False), ('おしえる', True), ('わすれる', True), ('べんきょうする', False),
+    ('はしる', False), ('とる', False), ('のる', False), ('わかる', False), ('うたう', False),
+]
+
+_CORPUS_SIZE = 5000
+
+# Public functions that take a string rather than a verb entry,
+# as (name, function to make an argument from a verb entry).
+_STRING_FUNCTIONS = [
+    ('unte', nhconj.te),
+    ('deinflect', nhconj.short_past_neg),
+    ('guess_is_ru_verb', lambda verb_entry: verb_entry.dict_verb),
+    ('romaji', lambda verb_entry: verb_entry.last_kana),
+    ('unromaji', lambda verb_entry: verb_entry.last_romaji),
+]
+
+# Times every public function over a Zipfian corpus of common verbs.
+# Use with --save and --compare to track regressions.
+@benchmark
+def functions():
+    corpus = _zipfian_entries(_CORPUS_SIZE, verbs=_CORPUS_VERBS)
+    print('functions (%d verbs):' % len(corpus))
+    
+    form_names = sorted(
+        name for name in dir(nhconj)
+        if hasattr(getattr(nhconj, name), 'expects_verb_entry'))
+    for form_name in form_names + ['conjugate_all']:
+        form = getattr(nhconj, form_name)
+        _report(form_name, _ns_per_call(form, corpus),
+            peak_bytes_per_call=_peak_bytes_per_call(form, corpus[:500]))
+    for (name, make_arg) in _STRING_FUNCTIONS:
+        func = getattr(nhconj, name)
+        args = [make_arg(verb_entry) for verb_entry in corpus]
+        _report(name, _ns_per_call(func, args),
+            peak_bytes_per_call=_peak_bytes_per_call(func, args[:500]))
+
+
+# ------------------------------------------------------------------------------
+# instrumentation
+
+@benchmark
+def instrumentation():
+    corpus = _zipfian_entries(_CORPUS_SIZE, verbs=_CORPUS_VERBS)
+    print('instrumentation (%d verbs):' % len(corpus))
+    for form_name in ['te', 'long_past_neg']:
+        baseline = _ns_per_call(getattr(nhconj, form_name), corpus)
+        _report(form_name + ' disabled', baseline)
+        nhconj.enable_instrumentation()
+        try:
+            _report(form_name + ' enabled',
+                _ns_per_call(getattr(nhconj, form_name), corpus), baseline)
+        finally:
+            nhconj.disable_instrumentation()
+        _report(form_name + ' disabled again',
+            _ns_per_call(getattr(nhconj, form_name), corpus), baseline)
+
+
+# ------------------------------------------------------------------------------
+# startup
+
+_STARTUP_RUNS = 10
+
+_STARTUP_WORDS = 'かきます\nいって\nたべられなかった\n'
+
+# Returns the best microseconds over several runs that `python3 -X importtime`
+# reports for importing module, including the modules that it imports.
+def _import_us(module):
+    best = None
+    for _ in range(_STARTUP_RUNS):
+        stderr = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.PIPE, check=True, encoding='utf-8').stderr
+        for line in stderr.splitlines():
+            (_, cumulative_us, name) = line.split('|')
+            if name.strip() == module:
+                best = min(best or float('inf'), int(cumulative_us))
+    return best
+
+# Returns the best seconds over several runs to run the CLI on _STARTUP_WORDS.
+def _cli_seconds(args):
+    best = None
+    for _ in range(_STARTUP_RUNS):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nhconj.py')]
+                + args,
+            input=_STARTUP_WORDS, stdout=subprocess.DEVNULL, check=True, encoding='utf-8')
+        best = min(best or float('inf'), time.perf_counter() - start)
+    return best
+
+# Times what a shell pipeline pays to start nhconj once per word.
+@benchmark
+def startup():
+    print('startup (best of %d processes):' % _STARTUP_RUNS)
+    _report('import nhconj', _import_us('nhconj') * 1e3)
+    local_ns = _cli_seconds(['--batch', 'deinflect']) * 1e9
+    _report('--batch deinflect', local_ns)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        address = 'unix:' + os.path.join(temp_dir, 'socket')
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nhconj.py'),
+                '--serve', address])
+        try:
+            _wait_for_unix_socket(address[len('unix:'):])
+            _report('--batch deinflect --connect',
+                _cli_seconds(['--batch', 'deinflect', '--connect', address]) * 1e9, local_ns)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+# ------------------------------------------------------------------------------
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmarks for nhconj.')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+        help='benchmarks to run (default: all)')
+    parser.add_argument('--save', metavar='PATH',
+        help='save results to PATH as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH',
+        help='fail if any result regressed from the JSON baseline at PATH')
+    parser.add_argument('--threshold', type=float, default=0.25, metavar='FRACTION',
+        help='allowed regression from the baseline (default: %(default)s)')
+    options = parser.parse_args(args)
+    
+    global _current_benchmark
+    names = options.names or list(_BENCHMARKS)
+    for name in names:
+        if name not in _BENCHMARKS:
+            print('*** Unknown benchmark: ' + name)
+            return 1
+    for name in names:
+        _current_benchmark = name
+        _BENCHMARKS[name]()
+    
+    results = {
+        'ns_per_call': _NS_PER_CALL,
+        'peak_bytes_per_call': _PEAK_BYTES_PER_CALL,
+    }
+    if options.save is not None:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        return _compare(results, baseline, options.threshold, names)
+    return 0
+
+# Prints every result that regressed from the baseline by more than
+# threshold, along with every result that the baseline has but the
+# benchmarks run did not report, and every new result. Only results of
+# the named benchmarks are compared.
+# 
+# Returns 1 if anything regressed or is missing, and 0 otherwise.
+def _compare(results, baseline, threshold, names):
+    regressions = 0
+    missing = 0
+    print()
+    print('Compared with baseline (threshold %+.0f%%):' % (threshold * 100))
+    for metric in sorted(set(results) | set(baseline)):
+        values = results.get(metric, {})
+        baseline_values = {
+            key: value for (key, value) in baseline.get(metric, {}).items()
+            if key.split('/', 1)[0] in names
+        }
+        for key in sorted(set(values) | set(baseline_values)):
+            if key not in values:
+                missing += 1
+                print('  *** %-40s %s missing' % (key, metric))
+                continue
+            if key not in baseline_values:
+                print('      %-40s %s new' % (key, metric))
+                continue
+            (value, baseline_value) = (values[key], baseline_values[key])
+            if not baseline_value:
+                continue
+            change = value / baseline_value - 1
+            if change > threshold:
+                regressions += 1
+                print('  *** %-40s %s %+.0f%%' % (key, metric, change * 100))
+    if regressions or missing:
+        print('  %d regressions, %d missing' % (regressions, missing))
+        return 1
+    print('  no regressions')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
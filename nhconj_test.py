@@ -1,17 +1,77 @@
 #!/usr/bin/env python3
 
+import asyncio
+import io
+import json
 import nhconj
+import nhconj_verify
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+import unittest.mock
 
 
 class TestNjconj(unittest.TestCase):
     def test_romaji(self):
         self.assertEqual(nhconj.romaji('く'), 'ku')
         self.assertEqual(nhconj.romaji('ん'), 'n')
+        self.assertEqual(nhconj.romaji('ク'), 'ku')
+        self.assertRaises(ValueError, nhconj.romaji, 'x')
+        self.assertEqual(nhconj.try_romaji('ク'), 'ku')
+        self.assertEqual(nhconj.try_romaji('x'), None)
+        self.assertEqual(nhconj.try_romaji('くく'), None)
     
     def test_unromaji(self):
         self.assertEqual(nhconj.unromaji('ku'), 'く')
         self.assertEqual(nhconj.unromaji('n'), 'ん')
+        self.assertRaises(ValueError, nhconj.unromaji, 'xq')
+        self.assertEqual(nhconj.try_unromaji('ku'), 'く')
+        self.assertEqual(nhconj.try_unromaji('xq'), None)
+    
+    def test_normalize(self):
+        self.assertEqual(nhconj.normalize('たべる'), 'たべる')
+        self.assertEqual(nhconj.normalize('タベル'), 'たべる')
+        self.assertEqual(nhconj.normalize('ググる'), 'ググる')  # katakana stem
+        self.assertEqual(nhconj.normalize('taberu'), 'たべる')
+        self.assertEqual(nhconj.normalize('Ｔａｂｅｒｕ'), 'たべる')
+        self.assertEqual(nhconj.normalize('benkyousuru'), 'べんきょうする')
+        self.assertEqual(nhconj.normalize('hanasu'), 'はなす')
+        self.assertEqual(nhconj.normalize('hanasu'), nhconj.normalize('hanasu'.upper()))
+        self.assertEqual(nhconj.normalize('tukau'), nhconj.normalize('tsukau'))
+        self.assertEqual(nhconj.normalize('kitte'), 'きって')
+        self.assertEqual(nhconj.normalize('matcha'), 'まっちゃ')
+        self.assertEqual(nhconj.normalize('onna'), 'おんな')
+        self.assertEqual(nhconj.normalize("kin'en"), 'きんえん')
+        self.assertEqual(nhconj.normalize('xyz'), 'xyz')  # not romaji
+        self.assertEqual(list(nhconj.normalize_lines(['yomu\n', 'ヨム\n'])), ['よむ', 'よむ'])
+    
+    def test_shift_vowel(self):
+        self.assertEqual(nhconj.shift_vowel('く', 'u', 'i'), 'き')
+        self.assertEqual(nhconj.shift_vowel('ぐ', 'u', 'a'), 'が')
+        self.assertEqual(nhconj.shift_vowel('て', 'e', 'a'), 'た')
+        self.assertEqual(nhconj.shift_vowel('う', 'u', 'a'), 'わ') # exception
+        self.assertRaises(ValueError, nhconj.shift_vowel, 'く', 'a', 'i')
+        self.assertRaises(ValueError, nhconj.shift_vowel, 'ん', 'u', 'i')
+        self.assertRaises(ValueError, nhconj.shift_vowel, '行', 'u', 'i')
+    
+    def test_verb_entry(self):
+        entry = nhconj.VerbEntry('べんきょうする', False)
+        self.assertEqual(entry.last_kana, 'る')
+        self.assertEqual(entry.last_romaji, 'ru')
+        self.assertEqual(entry.irregular_ending, 'する')
+        self.assertEqual(nhconj.VerbEntry('行く', False).last_romaji, 'ku')
+        self.assertEqual(nhconj.VerbEntry('たべる', True).irregular_ending, None)
+        # Compatible with dict verb entries
+        self.assertEqual(entry['dict_verb'], 'べんきょうする')
+        self.assertEqual(entry['is_ru_verb'], False)
+        self.assertEqual(nhconj.VerbEntry.from_dict(ve('たべる＋')), nhconj.VerbEntry('たべる', True))
+        self.assertEqual(nhconj.te(nhconj.VerbEntry('たべる', True)), nhconj.te(ve('たべる＋')))
+        # Immutable
+        self.assertRaises(AttributeError, setattr, entry, 'is_ru_verb', True)
+        self.assertRaises(AttributeError, setattr, entry, 'extra', 1)
     
     def test_stem(self):
         self.assertEqual(nhconj.stem(ve('するー')), 'し')
@@ -125,10 +185,82 @@ class TestNjconj(unittest.TestCase):
         self.assertEqual(nhconj.passive(ve('とるー')), 'とられる')
         self.assertEqual(nhconj.passive(ve('あそぶ')), 'あそばれる')
     
+    def test_causative(self):
+        self.assertEqual(nhconj.causative(ve('するー')), 'させる')
+        self.assertEqual(nhconj.causative(ve('くるー')), 'こさせる')
+        self.assertEqual(nhconj.causative(ve('たべる＋')), 'たべさせる')
+        self.assertEqual(nhconj.causative(ve('いく')), 'いかせる')
+        self.assertEqual(nhconj.causative(ve('かう')), 'かわせる')
+        self.assertEqual(nhconj.causative(ve('はなす')), 'はなさせる')
+        self.assertEqual(nhconj.causative(ve('とるー')), 'とらせる')
+    
+    def test_causative_passive(self):
+        self.assertEqual(nhconj.causative_passive(ve('するー')), 'させられる')
+        self.assertEqual(nhconj.causative_passive(ve('くるー')), 'こさせられる')
+        self.assertEqual(nhconj.causative_passive(ve('たべる＋')), 'たべさせられる')
+        self.assertEqual(nhconj.causative_passive(ve('いく')), 'いかされる')
+        self.assertEqual(nhconj.causative_passive(ve('かう')), 'かわされる')
+        self.assertEqual(nhconj.causative_passive(ve('はなす')), 'はなさせられる')  # exception
+        self.assertEqual(nhconj.causative_passive(ve('まつ')), 'またされる')
+    
+    def test_imperative(self):
+        self.assertEqual(nhconj.imperative(ve('するー')), 'しろ')
+        self.assertEqual(nhconj.imperative(ve('くるー')), 'こい')
+        self.assertEqual(nhconj.imperative(ve('たべる＋')), 'たべろ')
+        self.assertEqual(nhconj.imperative(ve('かく')), 'かけ')
+        self.assertEqual(nhconj.imperative(ve('とるー')), 'とれ')
+    
+    def test_tara(self):
+        self.assertEqual(nhconj.tara(ve('するー')), 'したら')
+        self.assertEqual(nhconj.tara(ve('たべる＋')), 'たべたら')
+        self.assertEqual(nhconj.tara(ve('いく')), 'いったら')
+        self.assertEqual(nhconj.tara(ve('よむ')), 'よんだら')
+    
+    def test_ba(self):
+        self.assertEqual(nhconj.ba(ve('するー')), 'すれば')
+        self.assertEqual(nhconj.ba(ve('くるー')), 'くれば')
+        self.assertEqual(nhconj.ba(ve('たべる＋')), 'たべれば')
+        self.assertEqual(nhconj.ba(ve('かう')), 'かえば')
+        self.assertEqual(nhconj.ba(ve('とるー')), 'とれば')
+    
     def test_chau(self):
         # 入る -> 入っちゃ います
         self.assertEqual(nhconj.chau(ve('入るー')), '入っちゃ')
     
+    def test_unte(self):
+        self.assertEqual(nhconj.unte('はなして'), ['はなす'])
+        self.assertEqual(nhconj.unte('わかって'), ['わかう', 'わかつ', 'わかる'])
+        self.assertEqual(nhconj.unte('よんで'), ['よむ', 'よぶ', 'よぬ'])
+        self.assertEqual(nhconj.unte('かいて'), ['かく'])
+        self.assertEqual(nhconj.unte('およいで'), ['およぐ'])
+        self.assertEqual(nhconj.unte('たべて'), ['たべる'])
+        self.assertEqual(nhconj.unte('いって'), ['いく']) # exception
+        self.assertEqual(nhconj.unte('行って'), ['行く', '行う']) # exception
+        self.assertEqual(nhconj.unte('よくて'), ['いい']) # exception
+        self.assertEqual(nhconj.unte('あつくて'), ['あつい'])
+        self.assertEqual(nhconj.unte('あつくなって'), ['あつい + negative'])
+        self.assertEqual(nhconj.unte('あつくなくて'), ['あつい + negative'])
+        self.assertEqual(nhconj.unte('しずかじゃなくて'), ['しずか + negative'])
+        self.assertEqual(nhconj.unte('げんきで'), ['げんき'])
+        self.assertRaises(ValueError, nhconj.unte, 'たべる')
+        self.assertRaises(ValueError, nhconj.unte, 'じゃなくて') # no stem
+        self.assertRaises(ValueError, nhconj.unte, 'で') # no stem
+    
+    def test_rank_unte(self):
+        frequency_table = nhconj.FrequencyTable(nhconj.read_frequencies([
+            '# word\tcount\n', 'よむ\t80\n', 'よぶ\t20\n', 'わかる\t50\n', '\n', 'あつい\n', 'よぶ\t20\n']))
+        self.assertEqual(len(frequency_table), 4)
+        self.assertIn('あつい', frequency_table)
+        self.assertEqual(frequency_table.count('よぶ'), 40)
+        self.assertEqual(frequency_table.count('よぬ'), 0)
+        self.assertEqual(nhconj.rank_unte('よんで', frequency_table), [('よむ', 2/3), ('よぶ', 1/3)])
+        self.assertEqual(nhconj.rank_unte('よんで', frequency_table, k=1), [('よむ', 2/3)])
+        self.assertEqual(nhconj.rank_unte('わかって', frequency_table), [('わかる', 1.0)])
+        self.assertEqual(nhconj.rank_unte('あつくなくて', frequency_table), [('あつい + negative', 1.0)])
+        self.assertEqual(nhconj.rank_unte('はなして', frequency_table), [])
+        with self.assertRaises(ValueError):
+            list(nhconj.read_frequencies(['よむ\tmany']))
+    
     def test_te(self):
         self.assertEqual(nhconj.te(ve('するー')), 'して')
         self.assertEqual(nhconj.te(ve('くるー')), 'きて')
@@ -148,6 +280,442 @@ class TestNjconj(unittest.TestCase):
     def test_te_neg(self):
         # 入れる -> 入れなくて も
         self.assertEqual(nhconj.te_neg(ve('入れる＋')), '入れなくて')
+    
+    def test_kanji_and_okurigana(self):
+        self.assertEqual(nhconj.te(ve('つくるー')), 'つくって')  # not くる
+        self.assertEqual(nhconj.short_present_neg(ve('おくるー')), 'おくらない')  # not くる
+        self.assertEqual(nhconj.te(ve('来るー')), '来て')
+        self.assertEqual(nhconj.short_present_neg(ve('持って来るー')), '持って来ない')
+        self.assertEqual(nhconj.imperative(ve('来るー')), '来い')
+        self.assertEqual(nhconj.te(ve('もってくるー')), 'もってきて')
+        self.assertEqual(nhconj.te(ve('出て行く')), '出て行って')
+        self.assertEqual(nhconj.te(ve('もっていく')), 'もっていって')
+        self.assertEqual(nhconj.short_present_neg(ve('かいてあるー')), 'かいてない')
+        self.assertEqual(nhconj.te(ve('たべちゃう')), 'たべちゃって')
+        
+        self.assertEqual(nhconj.unte('出て行って'), ['出て行く', '出て行う'])
+        self.assertEqual(nhconj.unte('もってきて'), ['もってくる'])
+        self.assertEqual(nhconj.unte('して'), ['する'])
+        self.assertIn(('来る', False, 'short_past_neg'), nhconj.deinflect('来なかった'))
+        self.assertNotIn(('来る', True, 'short_past_neg'), nhconj.deinflect('来なかった'))
+        self.assertEqual(nhconj.conjugate_many('te', ['でていく', 'つくる', '来る'], [False] * 3),
+            ['でていって', 'つくって', '来て'])
+        
+        self.assertEqual(nhconj.okurigana_split('出て行く'), ('出て行', 'く'))
+        self.assertEqual(nhconj.okurigana_split('たべる'), ('', 'たべる'))
+        self.assertEqual(nhconj.romaji('ゃ'), 'xya')
+        self.assertEqual(nhconj.romaji('カ'), 'ka')
+        self.assertRaises(ValueError, nhconj.romaji, '書')
+    
+    def test_deinflect(self):
+        self.assertIn(('はなす', False, 'te'), nhconj.deinflect('はなして'))
+        self.assertIn(('みる', True, 'long_past_neg'), nhconj.deinflect('みませんでした'))
+        self.assertIn(('よむ', False, 'short_past_aff'), nhconj.deinflect('よんだ'))
+        self.assertIn(('いく', False, 'tari'), nhconj.deinflect('いったり')) # exception
+        self.assertIn(('する', False, 'volitional'), nhconj.deinflect('しよう'))
+        self.assertIn(('くる', False, 'potential'), nhconj.deinflect('こられる'))
+        self.assertIn(('入る', False, 'chau'), nhconj.deinflect('入っちゃ'))
+        self.assertEqual(nhconj.deinflect('ない'), [('ある', False, 'short_present_neg')])
+        # Chained forms
+        self.assertIn(('たべる', True, 'passive+short_past_aff'), nhconj.deinflect('たべられた'))
+        self.assertIn(('よむ', False, 'passive+short_past_neg'), nhconj.deinflect('よまれなかった'))
+        # Implausible る-verbs are dropped
+        self.assertNotIn(('わかっる', True, 'te'), nhconj.deinflect('わかって'))
+        self.assertEqual(nhconj.deinflect('xyz'), [])
+    
+    def test_conjugate_adjective(self):
+        takai = nhconj.AdjectiveEntry('たかい', False)
+        shizuka = nhconj.AdjectiveEntry('しずか', True)
+        ii = nhconj.AdjectiveEntry('いい', False)
+        self.assertEqual(nhconj.conjugate_adjective(takai, 'long_past_neg'), 'たかくなかったです')
+        self.assertEqual(nhconj.conjugate_adjective(takai, 'short_past_aff'), 'たかかった')
+        self.assertEqual(nhconj.conjugate_adjective(takai, 'te_neg'), 'たかくなくて')
+        self.assertEqual(nhconj.conjugate_adjective(shizuka, 'short_present_aff'), 'しずかだ')
+        self.assertEqual(nhconj.conjugate_adjective(shizuka, 'long_present_neg'), 'しずかじゃないです')
+        self.assertEqual(nhconj.conjugate_adjective(shizuka, 'te'), 'しずかで')
+        self.assertEqual(nhconj.conjugate_adjective(ii, 'long_present_aff'), 'いいです')  # exception
+        self.assertEqual(nhconj.conjugate_adjective(ii, 'short_past_aff'), 'よかった')  # exception
+        self.assertEqual(nhconj.conjugate_adjective(
+            nhconj.AdjectiveEntry('かっこいい', False), 'te'), 'かっこよくて')  # exception
+        self.assertEqual(nhconj.conjugate_adjective(
+            nhconj.AdjectiveEntry('かわいい', False), 'te'), 'かわいくて')
+        self.assertEqual(len(nhconj.conjugate_all_adjective(takai)), 10)
+        self.assertRaises(ValueError, nhconj.AdjectiveEntry, 'しずか', False)
+        self.assertRaises(ValueError, nhconj.conjugate_adjective, takai, 'potential')
+    
+    def test_deinflect_adjective(self):
+        self.assertIn(('たかい', False, 'short_past_neg'), nhconj.deinflect_adjective('たかくなかった'))
+        self.assertIn(('いい', False, 'short_present_neg'), nhconj.deinflect_adjective('よくない'))
+        self.assertIn(('しずか', True, 'long_past_aff'), nhconj.deinflect_adjective('しずかでした'))
+        self.assertNotIn(('かわよい', False, 'short_present_neg'), nhconj.deinflect_adjective('かわいくない'))
+        self.assertEqual(nhconj.deinflect_adjective('xyz'), [])
+        
+        (verbs, adjectives) = nhconj.deinflect_word('たべたくない')
+        self.assertEqual(verbs, nhconj.deinflect('たべたくない'))
+        self.assertIn(('たべたい', False, 'short_present_neg'), adjectives)
+    
+    def test_scan(self):
+        text = '友達と寿司を食べました。本を読んでいる。日本に行って、写真を撮られなかった。'
+        found = list(nhconj.scan(io.StringIO(text), chunk_size=5))
+        self.assertEqual(
+            [(offset, surface) for (offset, surface, _) in found],
+            [(6, '食べました'), (14, '読んで'), (23, '行って'), (30, '撮られなかった')])
+        for (offset, surface, candidates) in found:
+            self.assertEqual(text[offset:offset + len(surface)], surface)
+            self.assertLessEqual(set(candidates), set(nhconj.deinflect(surface)))
+        self.assertIn(('食べる', True, 'long_past_aff'), found[0][2])
+        self.assertIn(('読む', False, 'te'), found[1][2])
+        self.assertIn(('撮る', False, 'passive+short_past_neg'), found[3][2])
+        self.assertEqual(found, list(nhconj.scan(io.StringIO(text))))
+    
+    def test_conjugate_many(self):
+        entries = [ve(d) for d in [
+            'するー', 'べんきょうするー', 'くるー', 'たべる＋', 'とるー', 'あるー',
+            'いく', '行く', 'かう', 'まつ', 'よむ', 'しぬ', 'およぐ', 'はなす']]
+        verbs = [e['dict_verb'] for e in entries]
+        is_ru_flags = [e['is_ru_verb'] for e in entries]
+        for form_name in ['stem', 'te', 'short_present_neg', 'potential', 'tari']:
+            form = getattr(nhconj, form_name)
+            self.assertEqual(
+                nhconj.conjugate_many(form_name, verbs, is_ru_flags),
+                [form(e) for e in entries])
+        self.assertRaises(ValueError, nhconj.conjugate_many, 'te', ['たべx'], [False])
+        self.assertRaises(ValueError, nhconj.conjugate_many, 'nonexistent', ['かく'], [False])
+        self.assertRaises(ValueError, nhconj.conjugate_many, 'te', ['かく', 'よむ'], [False])
+    
+    def test_conjugate_all(self):
+        for entry in [ve(d) for d in [
+                'するー', 'くるー', 'たべる＋', 'とるー', 'あるー', 'いく', '行く', 'かう', 'よむ']]:
+            forms = nhconj.conjugate_all(entry)
+            for (form_name, surface) in forms.items():
+                self.assertEqual(surface, getattr(nhconj, form_name)(entry))
+            self.assertEqual(
+                set(forms),
+                {f.__name__ for f in nhconj._DEINFLECTABLE_FORMS} | {'stem'})
+    
+    def test_form_dependencies(self):
+        for verb_entry in [ve('かえる+'), ve('かく'), ve('するー'), ve('くるー'), ve('いく'), ve('あるー'), ve('来るー')]:
+            forms = nhconj.conjugate_all(verb_entry)
+            for (form_name, (dependencies, derive)) in nhconj._FORM_DEPENDENCIES.items():
+                if derive is not None:
+                    self.assertEqual(derive(forms[dependencies[0]]), forms[form_name])
+        self.assertEqual(list(nhconj._FORM_DEPENDENCIES), list(nhconj.conjugate_all(ve('かく'))))
+        order = nhconj._FORM_DEPENDENCY_ORDER
+        self.assertLess(order.index('te'), order.index('short_past_aff'))
+        self.assertLess(order.index('short_past_aff'), order.index('tari'))
+    
+    def test_try_conjugate(self):
+        self.assertEqual(nhconj.try_conjugate(ve('かく'), 'te'), 'かいて')
+        self.assertEqual(nhconj.try_conjugate(ve('xyz'), 'te'), None)
+        self.assertEqual(nhconj.try_conjugate(ve('xyz'), 'short_present_aff'), 'xyz')
+        self.assertRaises(ValueError, nhconj.try_conjugate, ve('かく'), 'unte')
+        self.assertEqual(nhconj.try_unte('よんで'), nhconj.unte('よんで'))
+        self.assertEqual(nhconj.try_unte('よむ'), None)
+        
+        # Agrees with whether each form raises, and with what it says
+        dict_verbs = [
+            '〇' + kana for kana in nhconj._ROMAJI_FOR_ANY_KANA
+        ] + ['する', 'くる', '来る', 'いく', '行く', 'ある', 'x', '行', '']
+        for dict_verb in dict_verbs:
+            for is_ru_verb in [True, False]:
+                verb_entry = nhconj.VerbEntry(dict_verb, is_ru_verb)
+                for form_name in nhconj._FORM_DEPENDENCIES:
+                    validating_form = nhconj._VALIDATING_FORM_FOR_NAME[form_name]
+                    try:
+                        expected = getattr(nhconj, form_name)(verb_entry)
+                    except ValueError as e:
+                        self.assertFalse(nhconj.can_conjugate(verb_entry, form_name))
+                        self.assertEqual(validating_form.error_message + dict_verb, str(e))
+                    else:
+                        self.assertTrue(nhconj.can_conjugate(verb_entry, form_name))
+                        self.assertEqual(nhconj.try_conjugate(verb_entry, form_name), expected)
+                        if validating_form is not None:
+                            self.assertIn(dict_verb[-1:], validating_form.last_characters)
+    
+    def test_conjugation_table(self):
+        table = nhconj.ConjugationTable([ve('かえる+'), ve('かく'), ve('かく')])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.forms(ve('かえる+')), nhconj.conjugate_all(ve('かえる+')))
+        self.assertEqual(table.lookup('かえて'), [('かえる', True, 'te')])
+        
+        # Correcting the verb class reports only the forms that differ
+        diff = table.update(ve('かえる+'), ve('かえるー'))
+        self.assertIn(('te', 'かえて', 'かえって'), diff)
+        self.assertIn(('tari', 'かえたり', 'かえったり'), diff)
+        self.assertEqual(
+            set(nhconj.conjugate_all(ve('かく'))) - {form_name for (form_name, _, _) in diff},
+            {'short_present_aff', 'passive', 'ba'})
+        self.assertNotIn(ve('かえる+'), table)
+        self.assertEqual(table.forms(ve('かえるー')), nhconj.conjugate_all(ve('かえるー')))
+        self.assertEqual(table.lookup('かえて'), [])
+        self.assertEqual(table.lookup('かえって'), [('かえる', False, 'te')])
+        self.assertEqual(table.lookup('かえれば'), [('かえる', False, 'ba')])
+        
+        self.assertEqual(table.update(ve('かく'), ve('かく')), [])
+        self.assertRaises(ValueError, table.update, ve('かえるー'), ve('かく'))
+        self.assertEqual(table.add(ve('かく')), [])
+        diff = table.remove(ve('かく'))
+        self.assertIn(('te', 'かいて', None), diff)
+        self.assertEqual(table.lookup('かいて'), [])
+        self.assertEqual(list(table), [nhconj.VerbEntry('かえる', False)])
+        self.assertRaises(KeyError, table.remove, ve('かく'))
+    
+    def test_conjugate_chain(self):
+        self.assertEqual(
+            nhconj.conjugate_chain(ve('たべる＋'), 'causative_passive+short_past_neg'),
+            'たべさせられなかった')
+        self.assertEqual(nhconj.conjugate_chain(ve('かく'), 'causative+passive+te'), 'かかせられて')
+        self.assertEqual(nhconj.conjugate_chain(ve('かく'), 'te'), 'かいて')
+        self.assertRaises(ValueError, nhconj.conjugate_chain, ve('かく'), 'te+short_past_aff')
+        self.assertRaises(ValueError, nhconj.conjugate_chain, ve('かく'), 'passive+xyz')
+        
+        for surface in ['たべられた', 'かかされなかった', 'こさせられれば']:
+            for (dict_verb, is_ru_verb, chain) in nhconj.deinflect(surface):
+                self.assertEqual(
+                    nhconj.conjugate_chain(nhconj.VerbEntry(dict_verb, is_ru_verb), chain),
+                    surface)
+    
+    def test_paradigm(self):
+        forms = nhconj.paradigm(ve('よむ'))
+        self.assertEqual(len(forms), 62)
+        for (chain, surface) in forms.items():
+            self.assertEqual(nhconj.conjugate_chain(ve('よむ'), chain), surface)
+        self.assertEqual(forms['causative_passive+short_past_neg'], 'よまされなかった')
+    
+    def test_verify_verbs(self):
+        verbs = [
+            ('かく', False), ('たべる', True), ('する', False), ('くる', False), ('いく', False),
+            ('ある', False), ('かえる', True), ('かえる', False), ('もちいる', True), ('べんきょうする', False),
+        ]
+        (pair_count, mismatch_counts, examples) = nhconj_verify.verify_verbs(verbs)
+        self.assertEqual(pair_count, len(verbs) * (len(nhconj.paradigm(ve('かく'))) - 1))
+        # Reports the readings that unte() does not return, without failing
+        self.assertEqual(mismatch_counts, {('unte', 'te'): 2})
+        self.assertEqual(examples[('unte', 'te')], [
+            "もちいる+ -> もちいて -> ['もちく']",
+            "べんきょうする- -> べんきょうして -> ['べんきょうす']",
+        ])
+        
+        self.assertIn(('いる', True), nhconj_verify.synthetic_verbs(1))
+        self.assertNotIn(('くる', True), nhconj_verify.synthetic_verbs(1))
+    
+    def test_conjugate_all_cache(self):
+        nhconj.enable_conjugate_all_cache(maxsize=2)
+        try:
+            forms = nhconj.conjugate_all(ve('よむ'))
+            forms['te'] = 'corrupted'
+            self.assertEqual(nhconj.conjugate_all(ve('よむ'))['te'], 'よんで')
+            nhconj.conjugate_all(ve('たべる＋'))
+            nhconj.conjugate_all(ve('とるー'))
+            nhconj.conjugate_all(ve('よむ'))  # evicted
+            info = nhconj.conjugate_all_cache_info()
+            self.assertEqual((info.hits, info.misses, info.currsize), (1, 4, 2))
+        finally:
+            nhconj.disable_conjugate_all_cache()
+        self.assertEqual(nhconj.conjugate_all_cache_info(), None)
+    
+    def test_guess_is_ru_verb(self):
+        self.assertEqual(nhconj.guess_is_ru_verb('たべる'), True)
+        self.assertEqual(nhconj.guess_is_ru_verb('見る'), True)
+        self.assertEqual(nhconj.guess_is_ru_verb('わかる'), False)
+        self.assertEqual(nhconj.guess_is_ru_verb('はいる'), False)
+        self.assertEqual(nhconj.guess_is_ru_verb('帰る'), False)
+        self.assertEqual(nhconj.guess_is_ru_verb('かく'), False)
+        self.assertEqual(nhconj.guess_is_ru_verb('かえる'), None)
+        self.assertEqual(nhconj.guess_is_ru_verb('変える'), True)
+        self.assertEqual(nhconj.guess_is_ru_verb('廻る'), None)
+        
+        before = nhconj.verb_class_stats()
+        nhconj.run_batch('te', io.StringIO('しる\nかえる\n'), io.StringIO(), io.StringIO())
+        after = nhconj.verb_class_stats()
+        self.assertEqual(after['resolved'] - before['resolved'], 1)
+        self.assertEqual(after['fallback'] - before['fallback'], 1)
+    
+    def test_instrumentation(self):
+        te = nhconj.te
+        nhconj.enable_instrumentation()
+        try:
+            self.assertIsNot(nhconj.te, te)
+            nhconj.reset_instrumentation()
+            self.assertEqual(nhconj.te(ve('かく')), 'かいて')
+            self.assertEqual(nhconj.te(ve('たべる＋')), 'たべて')
+            self.assertEqual(nhconj.unte('わかって'), ['わかう', 'わかつ', 'わかる'])
+            self.assertRaises(ValueError, nhconj.unte, 'たべる')
+            self.assertEqual(nhconj.long_present_aff(ve('かく')), 'かきます')
+            self.assertEqual(nhconj.short_past_aff(ve('かく')), 'かいた')
+            stats = nhconj.instrumentation_stats()
+        finally:
+            nhconj.disable_instrumentation()
+        self.assertIs(nhconj.te, te)
+        
+        self.assertEqual(stats['te']['calls'], 3)  # also called by short_past_aff
+        self.assertEqual(stats['te']['branches'], { 'う-verb:く': 2, 'る-verb': 1 })
+        self.assertEqual(stats['unte']['branches'], { 'って': 1, 'none': 1 })
+        self.assertEqual(stats['unte']['exceptions'], { 'ValueError': 1 })
+        self.assertEqual(stats['stem']['calls'], 1)  # called by long_present_aff
+        self.assertEqual(stats['_replace_vowel_suffix']['branches'], { 'e->a': 1 })
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'stats')
+            nhconj.dump_instrumentation(path, 'prometheus')
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            self.assertIn('nhconj_calls_total{function="te"} 3\n', text)
+            self.assertIn('nhconj_exceptions_total{function="unte",exception="ValueError"} 1\n', text)
+            nhconj.dump_instrumentation(path, 'json')
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['te']['calls'], 3)
+    
+    def test_run_batch(self):
+        out_stream = io.StringIO()
+        err_stream = io.StringIO()
+        error_count = nhconj.run_batch(
+            'te', io.StringIO('かく\n\nたべる\nxyz\nかえる\nする\n'), out_stream, err_stream)
+        self.assertEqual(error_count, 1)
+        self.assertEqual(out_stream.getvalue(),
+            'かく\tかいて\tう-verb\n' +
+            'たべる\tたべて\tる-verb\n' +
+            'かえる\tかえて\tる-verb\n' +
+            'かえる\tかえって\tう-verb\n' +
+            'する\tして\t\n')
+        self.assertEqual(err_stream.getvalue(),
+            'xyz\tValueError: Expected verb in dictionary form: xyz\n')
+        
+        out_stream = io.StringIO()
+        nhconj.run_batch('unte', io.StringIO('いって\n'), out_stream, err_stream, 'jsonl')
+        self.assertEqual(out_stream.getvalue(),
+            '{"input": "いって", "output": "いく", "is_ru_verb": null}\n')
+        
+        # Katakana and romaji are normalized to hiragana
+        out_stream = io.StringIO()
+        nhconj.run_batch('te', io.StringIO('カク\nyomu\n'), out_stream, err_stream)
+        self.assertEqual(out_stream.getvalue(),
+            'カク\tかいて\tう-verb\n' +
+            'yomu\tよんで\tう-verb\n')
+    
+    def test_iter_batch_results_parallel(self):
+        words = ['かく', 'たべる', 'xyz', 'よむ', 'する', 'いく', 'とる'] * 5
+        serial = list(nhconj.iter_batch_results('te', words))
+        parallel = list(nhconj.iter_batch_results('te', words, workers=2, chunk_size=3))
+        self.assertEqual(parallel, serial)
+        self.assertEqual([word for (word, _, _) in parallel], words)
+        self.assertEqual(serial[0], ('かく', [(False, 'かいて')], None))
+        self.assertEqual(serial[2][2], 'ValueError: Expected verb in dictionary form: xyz')
+        
+        self.assertEqual(nhconj._non_negative_int('0'), 0)
+        with unittest.mock.patch('sys.stderr', io.StringIO()):
+            self.assertRaises(SystemExit, nhconj.main, ['--batch', 'te', '--workers', '-1'])
+            self.assertRaises(SystemExit, nhconj.main, ['--batch', 'te', '--chunk-size', '0'])
+        self.assertRaises(ValueError, list, nhconj.iter_batch_results('te', words, chunk_size=0))
+    
+    def test_read_lexicon(self):
+        self.assertEqual(
+            list(nhconj.read_lexicon(['たべる+\n', '# comment\n', '\n', 'とるー\n', 'かく\n', 'かえる\n'])),
+            [
+                nhconj.VerbEntry('たべる', True),
+                nhconj.VerbEntry('とる', False),
+                nhconj.VerbEntry('かく', False),
+                nhconj.VerbEntry('かえる', True),
+                nhconj.VerbEntry('かえる', False),
+            ])
+    
+    def test_conjugation_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'index')
+            nhconj.build_index(nhconj.read_lexicon(['たべる+', 'かえる', 'かく', 'するー']), path)
+            with nhconj.ConjugationIndex(path) as index:
+                self.assertEqual(index.lookup('かいて'), [('かく', False, 'te')])
+                self.assertEqual(index.lookup('かえって'), [('かえる', False, 'te')])
+                self.assertEqual(index.lookup('したり'), [('する', False, 'tari')])
+                self.assertEqual(index.lookup('たべ'), [('たべる', True, 'stem')])
+                self.assertEqual(index.lookup('よんで'), [])
+                self.assertEqual(
+                    index.conjugate('かえる', 'te'), [(False, 'かえって'), (True, 'かえて')])
+                self.assertEqual(index.conjugate('たべ', 'te'), [])
+                self.assertEqual(
+                    len(index.forms('かく')), len(nhconj.conjugate_all(ve('かく'))))
+    
+    def test_conjugation_server(self):
+        async def run(path):
+            server = nhconj.ConjugationServer()
+            await server.start('unix:' + path)
+            try:
+                (reader, writer) = await asyncio.open_unix_connection(path)
+                writer.write(
+                    b'{"id": 1, "command": "te", "word": "\xe3\x81\x8b\xe3\x81\x8f"}\n' +
+                    b'not json\n' +
+                    b'{"id": 3, "command": "nope", "word": "x"}\n' +
+                    json.dumps({ 'id': 4, 'command': 'unte', 'word': 'わかって' }).encode('utf-8') + b'\n')
+                writer.write_eof()
+                responses = [json.loads(line) for line in (await reader.read()).splitlines()]
+                writer.close()
+            finally:
+                await server.close()
+            return (responses, server.request_count)
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            (responses, request_count) = asyncio.run(run(os.path.join(temp_dir, 'socket')))
+        self.assertEqual(responses[0], { 'id': 1, 'results': [[False, 'かいて']] })
+        self.assertEqual(responses[1]['id'], None)
+        self.assertIn('error', responses[1])
+        self.assertEqual(responses[2]['id'], 3)
+        self.assertIn('error', responses[2])
+        self.assertEqual(responses[3], { 'id': 4, 'results': [
+            [None, 'わかう'], [None, 'わかつ'], [None, 'わかる']] })
+        self.assertEqual(request_count, 2)
+    
+    def test_conjugation_server_disconnect(self):
+        class DisconnectedWriter:
+            def write(self, data):
+                pass
+            async def drain(self):
+                raise ConnectionResetError()
+            def close(self):
+                pass
+        
+        async def run():
+            server = nhconj.ConjugationServer(max_pending_per_connection=2)
+            server._batch_task = asyncio.create_task(server._run_batches())
+            try:
+                reader = asyncio.StreamReader()
+                reader.feed_data(b'{"id": 1, "command": "te", "word": "x"}\n' * 10)
+                reader.feed_eof()
+                # Finishes, rather than waiting forever to queue more responses
+                await asyncio.wait_for(
+                    server._handle_connection(reader, DisconnectedWriter()), timeout=5)
+            finally:
+                server._batch_task.cancel()
+        
+        asyncio.run(run())
+    
+    def test_run_remote_batch(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            address = 'unix:' + os.path.join(temp_dir, 'socket')
+            process = subprocess.Popen([sys.executable, nhconj.__file__, '--serve', address])
+            try:
+                while True:
+                    try:
+                        nhconj._connect(address).close()
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+                
+                for command in ['te', 'deinflect']:
+                    for output_format in ['tsv', 'jsonl']:
+                        words = 'かく\n\nたべる\nxyz\nかえる\nする\nいって\n'
+                        (out_stream, err_stream) = (io.StringIO(), io.StringIO())
+                        error_count = nhconj.run_batch(
+                            command, io.StringIO(words), out_stream, err_stream, output_format)
+                        (remote_out_stream, remote_err_stream) = (io.StringIO(), io.StringIO())
+                        remote_error_count = nhconj.run_remote_batch(
+                            address, command, io.StringIO(words),
+                            remote_out_stream, remote_err_stream, output_format, chunk_size=2)
+                        self.assertEqual(remote_out_stream.getvalue(), out_stream.getvalue())
+                        self.assertEqual(remote_err_stream.getvalue(), err_stream.getvalue())
+                        self.assertEqual(remote_error_count, error_count)
+            finally:
+                process.terminate()
+                process.wait()
 
 def ve(dict_verb_descriptor):
     if dict_verb_descriptor[-1] in '+＋':
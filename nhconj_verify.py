@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Verifies that nhconj's forward forms and their inverses agree,
+# for every form of every verb in a lexicon or in a synthetic sweep.
+#
+# Usage:
+#   ./nhconj_verify.py                   - Verify synthetic verbs whose stems
+#                                          have up to 2 kana.
+#   ./nhconj_verify.py --lexicon <path>  - Verify the verbs in a lexicon,
+#                                          as read by nhconj.read_lexicon().
+#
+# Options:
+#   --stem-length <n>  - Longest synthetic stem, in kana. (default: 2)
+#   --workers <n>      - Processes to verify in, or 0 for one per CPU. (default: 0)
+#   --chunk-size <n>   - Verbs sent to a process at a time. (default: 200)
+#   --examples <n>     - Mismatches to show for each check and form. (default: 3)
+#
+# Exits with status 1 if there are any mismatches.
+#
+
+import argparse
+import collections
+import itertools
+import nhconj
+import sys
+import time
+
+
+# Checks, named as in the report:
+# * forward - the form agrees with paradigm(), and does not raise
+# * deinflect - deinflect() of the form finds the verb and form name again
+# * unte - unte() of the て-form finds the verb again
+# * conjugate_many - conjugate_many() agrees with the form
+_CHECKS = ['forward', 'deinflect', 'unte', 'conjugate_many']
+
+# Kana that synthetic stems are made of.
+_STEM_KANA = [
+    kana for (_, kanas) in nhconj._HIRAGANA_ROWS for kana in kanas if kana != '　'
+] + ['ん']
+
+_U_VERB_ENDINGS = 'うくぐすつぬぶむる'
+
+# Yields (dict_verb, is_ru_verb) for every stem of up to stem_length kana
+# followed by every う-verb ending, and as a る-verb where the stem ends with
+# an い- or え-sound, like every る-verb.
+#
+# Skipped are:
+# * a る-verb spelled like an irregular or exceptional verb, which conjugates
+#   as the う-verb of the same spelling (ex: くる), and
+# * a る-verb ending in しる, which does not exist, and whose て-form
+#   unte() reads as a す-verb instead.
+def synthetic_verbs(stem_length):
+    for length in range(1, stem_length + 1):
+        for stem in itertools.product(_STEM_KANA, repeat=length):
+            stem = ''.join(stem)
+            for ending in _U_VERB_ENDINGS:
+                yield (stem + ending, False)
+            if nhconj.romaji(stem[-1])[-1] in 'ie' and stem[-1] != 'し' and \
+                    nhconj.VerbEntry(stem + 'る', True).conjugation_class == 'る-verb':
+                yield (stem + 'る', True)
+
+# Verifies every form of each (dict_verb, is_ru_verb) in verbs, returning
+# (pair_count, mismatch_counts, examples), where:
+# * pair_count is the number of verb/form pairs checked,
+# * mismatch_counts counts mismatches by (check, form_name), and
+# * examples holds up to max_examples descriptions of each.
+def verify_verbs(verbs, max_examples=3):
+    pair_count = 0
+    mismatch_counts = collections.Counter()
+    examples = collections.defaultdict(list)
+    
+    def mismatch(check, form_name, verb_entry, detail):
+        mismatch_counts[(check, form_name)] += 1
+        if len(examples[(check, form_name)]) < max_examples:
+            examples[(check, form_name)].append(
+                verb_entry.dict_verb + ('+' if verb_entry.is_ru_verb else '-') + ' ' + detail)
+    
+    verb_entries = []
+    paradigms = []
+    for (dict_verb, is_ru_verb) in verbs:
+        verb_entry = nhconj.VerbEntry(dict_verb, is_ru_verb)
+        try:
+            forms = nhconj.paradigm(verb_entry)
+        except ValueError as e:
+            mismatch('forward', 'paradigm', verb_entry, str(e))
+            continue
+        verb_entries.append(verb_entry)
+        paradigms.append(forms)
+        
+        for (form_name, surface) in forms.items():
+            if form_name == 'stem':
+                continue
+            pair_count += 1
+            try:
+                expected = nhconj.conjugate_chain(verb_entry, form_name)
+            except ValueError as e:
+                mismatch('forward', form_name, verb_entry, str(e))
+                continue
+            if expected != surface:
+                mismatch('forward', form_name, verb_entry,
+                    '-> ' + expected + ', but paradigm() -> ' + surface)
+                continue
+            if (dict_verb, is_ru_verb, form_name) not in nhconj.deinflect(surface):
+                mismatch('deinflect', form_name, verb_entry,
+                    '-> ' + surface + ' -> ' + repr(nhconj.deinflect(surface)))
+        
+        te_form = forms['te']
+        if dict_verb not in nhconj.unte(te_form):
+            mismatch('unte', 'te', verb_entry,
+                '-> ' + te_form + ' -> ' + repr(nhconj.unte(te_form)))
+    
+    dict_verbs = [verb_entry.dict_verb for verb_entry in verb_entries]
+    is_ru_flags = [verb_entry.is_ru_verb for verb_entry in verb_entries]
+    for form in nhconj._DEINFLECTABLE_FORMS:
+        form_name = form.__name__
+        try:
+            surfaces = nhconj.conjugate_many(form_name, dict_verbs, is_ru_flags)
+        except ValueError as e:
+            mismatch('conjugate_many', form_name, verb_entries[0], str(e))
+            continue
+        for (verb_entry, forms, surface) in zip(verb_entries, paradigms, surfaces):
+            if surface != forms[form_name]:
+                mismatch('conjugate_many', form_name, verb_entry,
+                    '-> ' + surface + ', but paradigm() -> ' + forms[form_name])
+    
+    return (pair_count, mismatch_counts, examples)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Verifies that conjugations and their inverses agree.')
+    parser.add_argument('--lexicon', metavar='PATH',
+        help='verify the verbs in the lexicon at PATH instead of synthetic verbs')
+    parser.add_argument('--stem-length', type=int, default=2, metavar='N',
+        help='longest synthetic stem, in kana (default: %(default)s)')
+    parser.add_argument('--workers', type=nhconj._non_negative_int, default=0, metavar='N',
+        help='processes to verify in, or 0 for one per CPU (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=nhconj._positive_int, default=200, metavar='N',
+        help='verbs sent to a process at a time (default: %(default)s)')
+    parser.add_argument('--examples', type=int, default=3, metavar='N',
+        help='mismatches to show for each check and form (default: %(default)s)')
+    options = parser.parse_args(args)
+    
+    if options.lexicon is not None:
+        with open(options.lexicon, encoding='utf-8') as f:
+            verbs = [
+                (verb_entry.dict_verb, verb_entry.is_ru_verb)
+                for verb_entry in nhconj.read_lexicon(f)
+            ]
+    else:
+        verbs = synthetic_verbs(options.stem_length)
+    
+    start = time.perf_counter()
+    verb_count = 0
+    pair_count = 0
+    mismatch_counts = collections.Counter()
+    examples = collections.defaultdict(list)
+    chunk_results = nhconj._map_chunks(
+        _verify_chunk, (options.examples,), verbs, options.workers or None, options.chunk_size)
+    for (chunk_verb_count, chunk_pair_count, chunk_mismatch_counts, chunk_examples) in chunk_results:
+        verb_count += chunk_verb_count
+        pair_count += chunk_pair_count
+        mismatch_counts.update(chunk_mismatch_counts)
+        for (key, descriptions) in chunk_examples.items():
+            examples[key].extend(descriptions[:options.examples - len(examples[key])])
+    elapsed = time.perf_counter() - start
+    
+    print('Verified %d verb/form pairs of %d verbs in %.1f s.' % (
+        pair_count, verb_count, elapsed))
+    _print_report(mismatch_counts, examples)
+    return 1 if mismatch_counts else 0
+
+# Verifies one chunk of verbs in a worker process. See verify_verbs().
+def _verify_chunk(max_examples, verbs):
+    (pair_count, mismatch_counts, examples) = verify_verbs(verbs, max_examples)
+    return (len(verbs), pair_count, mismatch_counts, dict(examples))
+
+# Prints one line per (check, form_name) that has mismatches,
+# followed by its examples.
+def _print_report(mismatch_counts, examples):
+    if not mismatch_counts:
+        print('No mismatches.')
+        return
+    print('%d mismatches:' % sum(mismatch_counts.values()))
+    for ((check, form_name), count) in sorted(
+            mismatch_counts.items(), key=lambda item: (_CHECKS.index(item[0][0]), item[0][1])):
+        print('  %-15s %-36s %8d' % (check, form_name, count))
+        for description in examples[(check, form_name)]:
+            print('      ' + description)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))